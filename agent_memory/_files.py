@@ -0,0 +1,345 @@
+"""File helpers shared by the SDK, the CLI store, config and the vector store."""
+import copy
+import json
+import mmap
+import os
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    import orjson
+    _ORJSON_LINE = orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except ImportError:  # orjson is optional
+    orjson = None
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON from str or bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_line(obj: Any) -> bytes:
+    """Serialize obj as one compact UTF-8 JSON line (with trailing newline)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=_ORJSON_LINE)
+        except TypeError:
+            pass  # e.g. ints beyond 64 bits, which json handles
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def id_needle(memory_id: str) -> bytes:
+    """Bytes of memory_id as a JSON string, to find its records without parsing."""
+    return json.dumps(memory_id, ensure_ascii=False).encode("utf-8")
+
+
+def dumps_pretty(obj: Any) -> str:
+    """Serialize obj as 2-space indented JSON, same layout as json.dumps(indent=2)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+def write_export(entries: Iterable[dict], fmt: str, write: Callable[[str], Any]):
+    """Write entries as a markdown or JSON export, one piece at a time.
+
+    The output matches dumps_pretty(entries) for "json" and the markdown
+    export otherwise, without holding it all in memory at once.
+    """
+    if fmt == "json":
+        first = True
+        for e in entries:
+            write("[\n  " if first else ",\n  ")
+            write(dumps_pretty(e).replace("\n", "\n  "))
+            first = False
+        write("[]" if first else "\n]")
+        return
+    write("# Agent Memory Export\n")
+    for e in entries:
+        # One write per entry
+        ts = e.get("timestamp", "")[:19].replace("T", " ")
+        tags = ", ".join(e.get("tags", []))
+        tag_line = f"**Tags:** {tags}\n" if tags else ""
+        write(f"\n## {e['id']} ({ts})\n{tag_line}\n{e['text']}\n")
+
+
+def utc_now() -> datetime:
+    """Default clock for entry timestamps and time decay."""
+    return datetime.now(timezone.utc)
+
+
+def new_entry(text: str, tags=None, metadata=None, importance=3, timestamp: Optional[str] = None) -> dict:
+    """A fresh memory entry, importance clamped to 1-5, timestamped now by default."""
+    return {
+        "id": uuid.uuid4().hex[:12],
+        "timestamp": timestamp or utc_now().isoformat(),
+        "text": text,
+        "tags": tags or [],
+        "metadata": metadata or {},
+        "importance": max(1, min(5, int(importance))),
+    }
+
+
+def new_entries(items: Iterable[Union[str, dict]], timestamp: Optional[str] = None) -> List[dict]:
+    """new_entry() for each text or {text, tags, metadata, importance} dict,
+    all sharing one timestamp (now by default)."""
+    timestamp = timestamp or utc_now().isoformat()
+    entries = []
+    for item in items:
+        if isinstance(item, str):
+            item = {"text": item}
+        entries.append(new_entry(
+            item["text"], item.get("tags"), item.get("metadata"),
+            item.get("importance", 3), timestamp,
+        ))
+    return entries
+
+
+def copy_entry(entry: dict) -> dict:
+    """Copy of an entry for handing to callers, so editing it (tags and
+    metadata included) can't change a cached entry."""
+    e = dict(entry)
+    if isinstance(e.get("tags"), list):
+        e["tags"] = list(e["tags"])
+    if e.get("metadata"):
+        e["metadata"] = copy.deepcopy(e["metadata"])
+    return e
+
+
+# memories.jsonl is an append-only log: besides full entries it may hold
+#   {"id": ..., "_del": true}                                 delete
+#   {"id": ..., "_tag_patch": {"add": [...], "remove": [...]}}  tag edit
+DELETED = "_del"
+TAG_PATCH = "_tag_patch"
+
+
+def stat_key(path: Path) -> Optional[Tuple[int, int]]:
+    """Return (mtime_ns, size) for path, or None if it doesn't exist.
+
+    Used as a cheap cache key: one stat() call tells whether a file
+    changed since it was last parsed.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def iter_lines(path: Path) -> Iterator[bytes]:
+    """Yield the non-blank lines of path as bytes, without decoding the file."""
+    with open(path, "rb") as f:
+        for raw in f:
+            raw = raw.strip()
+            if raw:
+                yield raw
+
+
+def count_plain_lines(path: Path, markers: Iterable[bytes] = (), chunk_size: int = 1 << 20) -> Optional[int]:
+    """Count the lines of a JSONL file without parsing it.
+
+    Returns None, so the caller can fall back to a full parse, if any line
+    does not start with "{" (blank lines, hand edits) or any of markers
+    occurs anywhere in the file. Reads fixed-size chunks and counts with
+    bytes.count, so memory use stays flat.
+    """
+    markers = [m for m in markers if m]
+    keep = max((len(m) for m in markers), default=1) - 1
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    newlines = opens = 0
+    last = b"\n"  # the first line starts right after a virtual newline
+    tail = b""
+    with f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            newlines += chunk.count(b"\n")
+            opens += (last + chunk).count(b"\n{")
+            window = tail + chunk
+            if any(m in window for m in markers):
+                return None
+            last = chunk[-1:]
+            tail = window[-keep:] if keep else b""
+    if not newlines and last == b"\n" and not opens:
+        return 0  # empty file
+    starts = 1 + newlines - (last == b"\n")
+    return opens if opens == starts else None
+
+
+def rfind_lines(path: Path, needle: bytes) -> Iterator[bytes]:
+    """Yield lines of path that contain needle, last match first.
+
+    The file is mmap'd and searched with mm.rfind, so only matching lines
+    are copied out; nothing else is decoded or parsed.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return  # mmap can't map an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm)
+            while True:
+                pos = mm.rfind(needle, 0, end)
+                if pos < 0:
+                    return
+                start = mm.rfind(b"\n", 0, pos) + 1
+                stop = mm.find(b"\n", pos)
+                if stop < 0:
+                    stop = len(mm)
+                yield mm[start:stop]
+                end = start
+
+
+def tail_entries(path: Path, n: int, line_hint: int = 256) -> Optional[List[dict]]:
+    """Last n live entries of memories.jsonl, parsing only the end of the file.
+
+    Reads a window of about n * line_hint bytes from the end, replays the
+    complete lines in it and doubles the window until it holds n live
+    entries or covers the whole file. Returns None when the window can't
+    decide the answer: a tag patch applies to the first entry with its id,
+    which might lie before the window, so any such id seen there sends the
+    caller back to a full load.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        window = max(8192, n * line_hint)
+        while True:
+            start = max(0, size - window)
+            f.seek(start)
+            data = f.read(size - start)
+            first = start
+            if start > 0:
+                # Drop the partial line the window starts in
+                cut = data.find(b"\n") + 1 if b"\n" in data else len(data)
+                data = data[cut:]
+                first += cut
+            records = [loads(raw) for raw in (line.strip() for line in data.split(b"\n")) if raw]
+            entries, _ = replay(records)
+            if len(entries) >= n or start == 0:
+                break
+            window *= 2
+        patched = {r.get("id") for r in records if TAG_PATCH in r}
+        if patched and first > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if any(mm.find(id_needle(mid), 0, first) >= 0 for mid in patched if isinstance(mid, str)):
+                    return None
+    return entries[-n:]
+
+
+def find_record(path: Path, memory_id: str) -> Tuple[bool, Optional[dict]]:
+    """Replay the records of one id without parsing the rest of the file.
+
+    Scans backwards for memory_id (rfind_lines) and returns (known, entry).
+    known is False when the scan can't decide and the caller should replay
+    the whole file: no entry found (e.g. an id stored JSON-escaped), or
+    more than one live entry with that id. Otherwise entry is the live
+    entry with its tag patches applied, or None if it was deleted.
+    """
+    patches = []
+    entry = None
+    for line in rfind_lines(path, id_needle(memory_id)):
+        try:
+            rec = loads(line)
+        except ValueError:
+            continue
+        if not isinstance(rec, dict) or rec.get("id") != memory_id:
+            continue
+        if rec.get(DELETED):
+            if entry is None:
+                return True, None
+            break  # everything before a delete is dead
+        if TAG_PATCH in rec:
+            if entry is None:
+                patches.append(rec[TAG_PATCH])  # comes after the entry
+        elif entry is not None:
+            return False, None  # duplicate ids: patches go to the first one
+        else:
+            entry = rec
+    if entry is None:
+        return False, None
+    for patch in reversed(patches):
+        entry["tags"] = patch_tags(entry.get("tags", []), patch.get("add"), patch.get("remove"))
+    return True, entry
+
+
+def count_records(path: Path, markers: Iterable[bytes], chunk_size: int = 1 << 20) -> Tuple[int, List[int]]:
+    """(newlines in path, occurrences of each marker), counted in chunks."""
+    markers = list(markers)
+    keep = max((len(m) for m in markers), default=1) - 1
+    lines = 0
+    counts = [0] * len(markers)
+    tail = b""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return 0, counts
+    with f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            lines += chunk.count(b"\n")
+            # A match can't fit inside tail alone, so none is counted twice
+            window = tail + chunk
+            for i, m in enumerate(markers):
+                counts[i] += window.count(m)
+            tail = window[-keep:] if keep else b""
+    return lines, counts
+
+
+def needs_compaction(path: Path) -> bool:
+    """Estimate, without parsing, whether dead records outnumber live entries.
+
+    Assumes every delete removed one entry. Stray marker strings inside
+    entries only shift when compaction happens, never what it keeps.
+    """
+    lines, (deletes, patches) = count_records(path, (json.dumps(DELETED).encode(), json.dumps(TAG_PATCH).encode()))
+    return lines > 2 * max(0, lines - 2 * deletes - patches)
+
+
+def patch_tags(tags: Iterable[str], add: Optional[Iterable[str]], remove: Optional[Iterable[str]]) -> List[str]:
+    """Apply a tag edit, returning the new sorted tag list."""
+    result = set(tags)
+    if add:
+        result.update(add)
+    if remove:
+        result.difference_update(remove)
+    return sorted(result)
+
+
+def replay(records: Iterable[dict]) -> Tuple[List[dict], int]:
+    """Collapse memories.jsonl records into live entries, in file order.
+
+    Returns (entries, number of records read). A delete drops every entry
+    with that id; a tag patch edits the first one.
+    """
+    entries: List[Optional[dict]] = []
+    where: Dict[str, List[int]] = {}
+    n = 0
+    for rec in records:
+        n += 1
+        mid = rec.get("id")
+        if rec.get(DELETED):
+            for i in where.pop(mid, ()):
+                entries[i] = None
+        elif TAG_PATCH in rec:
+            positions = where.get(mid)
+            if positions:
+                e = entries[positions[0]]
+                patch = rec[TAG_PATCH]
+                e["tags"] = patch_tags(e.get("tags", []), patch.get("add"), patch.get("remove"))
+        else:
+            where.setdefault(mid, []).append(len(entries))
+            entries.append(rec)
+    if n == len(entries):
+        return entries, n  # Fast path: nothing was deleted
+    return [e for e in entries if e is not None], n
@@ -0,0 +1,691 @@
+"""Inverted index for TF-IDF keyword search, with an on-disk sidecar."""
+import heapq
+import math
+import os
+import re
+import sys
+import zlib
+from array import array
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Collection, Dict, Iterable, List, Optional, Tuple
+
+from ._files import DELETED, TAG_PATCH, dumps_line, loads, patch_tags
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional
+    np = None
+
+try:
+    import numba
+except ImportError:  # numba is optional, and only used together with numpy
+    numba = None
+
+
+_WORD_RE = re.compile(r"\w+")
+# Byte table that lowercases ASCII word characters and maps every other byte
+# to a space, so bytes.split() yields the lowercased \w+ runs in one C pass
+_ASCII_WORDS = bytes(
+    ord(chr(b).lower()) if chr(b).isalnum() and b < 128 or b == 0x5F else 0x20
+    for b in range(256)
+)
+
+
+def tokenize(text: str) -> List[str]:
+    if text.isascii():
+        return text.encode("ascii").translate(_ASCII_WORDS).decode("ascii").split()
+    return _WORD_RE.findall(text.lower())
+
+
+def entry_time(entry: dict) -> Optional[float]:
+    """POSIX timestamp of an entry, or None if missing, unparseable or naive."""
+    try:
+        t = datetime.fromisoformat(entry.get("timestamp", ""))
+    except (ValueError, TypeError):
+        return None
+    if t.tzinfo is None:
+        return None  # can't be compared with an aware "now"
+    return t.timestamp()
+
+
+def entry_tokens(entry: dict) -> List[str]:
+    """Tokens of an entry's text plus its tags."""
+    return tokenize(entry["text"] + " " + " ".join(entry.get("tags", [])))
+
+
+def _bisect_doc(items: list, doc: int, key: Optional[int] = None) -> int:
+    """Leftmost position for doc in a doc-sorted list (of (doc, ...) if key=0)."""
+    lo, hi = 0, len(items)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if (items[mid] if key is None else items[mid][key]) < doc:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+# Below this many hits, per-doc Python arithmetic beats numpy's setup cost
+_NUMPY_MIN_HITS = 256
+# numba's single dense pass pays off once hits are a sizeable share of large stores
+_NUMBA_MIN_HITS = 65536
+
+
+class KeywordIndex:
+    """Inverted index (token -> [(doc, tf)]) over a list of entries.
+
+    Built once per loaded entry list so queries only visit the postings of
+    their own tokens instead of re-tokenizing every stored entry. Removed
+    entries leave a hole (entry and id None) so later docs keep their
+    numbers; len() counts live docs only.
+    """
+
+    def __init__(self, entries: Iterable[dict] = ()):
+        self.entries: List[Optional[dict]] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_len: List[int] = []
+        self.tag_docs: Dict[str, List[int]] = {}
+        # Per doc, the tags it was indexed with and its id; id -> its live docs
+        self.tags: List[List[str]] = []
+        self.ids: List[Optional[str]] = []
+        self.id_docs: Dict[str, List[int]] = {}
+        self.removed = 0
+        # Removed docs whose entry wasn't at hand, still in the postings
+        self._unswept: List[int] = []
+        # Per doc, parsed once: POSIX timestamp (NaN if unknown) and importance / 3
+        self.times: List[float] = []
+        self.weights: List[float] = []
+        self._arrays: Optional[tuple] = None
+        # numpy only: token -> (version, docs, tfs) of its postings
+        self._version = 0
+        self._token_arrays: Dict[str, tuple] = {}
+        for e in entries:
+            self.add(e)
+
+    def __len__(self) -> int:
+        return len(self.ids) - self.removed
+
+    def first_doc(self, entry_id: str) -> Optional[int]:
+        """First live doc with entry_id (the one a tag patch edits), or None."""
+        docs = self.id_docs.get(entry_id)
+        return docs[0] if docs else None
+
+    def add(self, entry: dict):
+        """Index one more entry at the end."""
+        doc = len(self.ids)
+        tokens = entry_tokens(entry)
+        self.entries.append(entry)
+        self.ids.append(entry["id"])
+        self.id_docs.setdefault(entry["id"], []).append(doc)
+        self.doc_len.append(len(tokens))
+        t = entry_time(entry)
+        self.times.append(math.nan if t is None else t)
+        self.weights.append(entry.get("importance", 3) / 3.0)
+        self._version += 1
+        tags = list(entry.get("tags", []))
+        self.tags.append(tags)
+        for tag in set(tags):
+            self.tag_docs.setdefault(tag, []).append(doc)
+        postings = self.postings
+        for t, count in Counter(tokens).items():
+            if t in postings:
+                postings[t].append((doc, count))
+            else:
+                postings[t] = [(doc, count)]
+
+    def retag(self, doc: int, tags: Iterable[str]):
+        """Re-index doc after its tags changed, touching only the tag tokens.
+
+        Entry tokens are the text tokens followed by the tag tokens, so the
+        text part of the postings is left as is.
+        """
+        self._version += 1
+        old = self.tags[doc]
+        tags = list(tags)
+        self.tags[doc] = tags
+        for tag in set(old) - set(tags):
+            docs = self.tag_docs[tag]
+            del docs[_bisect_doc(docs, doc)]
+            if not docs:
+                del self.tag_docs[tag]
+        for tag in set(tags) - set(old):
+            docs = self.tag_docs.setdefault(tag, [])
+            docs.insert(_bisect_doc(docs, doc), doc)
+        delta = Counter(tokenize(" ".join(tags)))
+        delta.subtract(tokenize(" ".join(old)))
+        for t, d in delta.items():
+            if d:
+                self._shift_tf(t, doc, d)
+        self.doc_len[doc] += sum(delta.values())
+
+    def remove(self, entry_id: str) -> bool:
+        """Drop every doc with entry_id, like a delete record does.
+
+        Only the removed docs' own postings are touched. Docs loaded from a
+        sidecar whose entry isn't bound yet are dropped from the postings
+        by sweep() instead. Returns False if no live doc had the id.
+        """
+        docs = self.id_docs.pop(entry_id, None)
+        if not docs:
+            return False
+        self._version += 1
+        for doc in docs:
+            tags = self.tags[doc]
+            for tag in set(tags):
+                tagged = self.tag_docs[tag]
+                del tagged[_bisect_doc(tagged, doc)]
+                if not tagged:
+                    del self.tag_docs[tag]
+            entry = self.entries[doc]
+            if entry is None:
+                self._unswept.append(doc)
+            else:
+                tokens = tokenize(entry["text"] + " " + " ".join(tags))
+                for t, count in Counter(tokens).items():
+                    self._shift_tf(t, doc, -count)
+            self.entries[doc] = self.ids[doc] = None
+            self.tags[doc] = []
+            self.doc_len[doc] = 0
+            self.removed += 1
+        return True
+
+    def sweep(self):
+        """Drop removed docs that remove() couldn't tokenize from the postings."""
+        if not self._unswept:
+            return
+        gone = set(self._unswept)
+        self._unswept.clear()
+        self._version += 1
+        for token, plist in list(self.postings.items()):
+            kept = [p for p in plist if p[0] not in gone]
+            if not kept:
+                del self.postings[token]
+            elif len(kept) != len(plist):
+                self.postings[token] = kept
+
+    def bind(self, entries: List[dict]) -> bool:
+        """Attach the live entries, in doc order, to a from_state() index.
+
+        Returns False (leaving the index unusable) if their ids don't
+        match the live docs'.
+        """
+        live = [doc for doc, mid in enumerate(self.ids) if mid is not None]
+        if len(live) != len(entries):
+            return False
+        ids = self.ids
+        for doc, e in zip(live, entries):
+            if ids[doc] != e.get("id"):
+                return False
+            self.entries[doc] = e
+        return True
+
+    def _shift_tf(self, token: str, doc: int, delta: int):
+        postings = self.postings.setdefault(token, [])
+        i = _bisect_doc(postings, doc, key=0)
+        if i < len(postings) and postings[i][0] == doc:
+            tf = postings[i][1] + delta
+            if tf > 0:
+                postings[i] = (doc, tf)
+            else:
+                del postings[i]
+        elif delta > 0:
+            postings.insert(i, (doc, delta))
+        if not postings:
+            del self.postings[token]
+
+    def state(self) -> dict:
+        """JSON-serializable form of everything but the entries themselves.
+
+        Removed docs are left out, renumbering the live ones from 0.
+        """
+        self.sweep()
+        postings, doc_len, tags, ids = self.postings, self.doc_len, self.tags, self.ids
+        times, weights = self.times, self.weights
+        if self.removed:
+            live = [doc for doc, mid in enumerate(ids) if mid is not None]
+            new_doc = {doc: i for i, doc in enumerate(live)}
+            postings = {t: [(new_doc[d], tf) for d, tf in plist] for t, plist in postings.items()}
+            doc_len = [doc_len[d] for d in live]
+            tags = [tags[d] for d in live]
+            ids = [ids[d] for d in live]
+            times = [times[d] for d in live]
+            weights = [weights[d] for d in live]
+        return {
+            "postings": postings,
+            "doc_len": doc_len,
+            "tags": tags,
+            "ids": ids,
+            "times": [None if t != t else t for t in times],
+            "weights": weights,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "KeywordIndex":
+        """Inverse of state(). Call bind() with the entries before searching.
+
+        Tags are taken from the state, not the entries, so patches made
+        since can still be applied with retag().
+        """
+        index = cls()
+        index.ids = state["ids"]
+        index.entries = [None] * len(index.ids)
+        index.postings = state["postings"]  # [doc, tf] lists unpack like the tuples
+        index.doc_len = state["doc_len"]
+        index.tags = state["tags"]
+        for doc, tags in enumerate(index.tags):
+            for tag in set(tags):
+                index.tag_docs.setdefault(tag, []).append(doc)
+        for doc, mid in enumerate(index.ids):
+            index.id_docs.setdefault(mid, []).append(doc)
+        index.times = [math.nan if t is None else t for t in state["times"]]
+        index.weights = state["weights"]
+        return index
+
+    def idf(self, token: str) -> float:
+        n = len(self)
+        return math.log((n + 1) / (len(self.postings.get(token, ())) + 0.5))
+
+    def docs_with_tag(self, tag: str) -> List[int]:
+        return self.tag_docs.get(tag, [])
+
+    def scores(
+        self,
+        query_tokens: Iterable[str],
+        docs: Optional[Collection[int]] = None,
+    ) -> Dict[int, float]:
+        """Raw TF-IDF score per doc index, for docs matching any query token.
+
+        docs: restrict scoring to these doc indices. N and df are then
+        counted within the subset, as if only those entries were indexed.
+        """
+        scores: Dict[int, float] = {}
+        for qt in query_tokens:
+            postings = self.postings.get(qt)
+            if not postings:
+                continue
+            if docs is None:
+                idf = self.idf(qt)
+            else:
+                postings = [p for p in postings if p[0] in docs]
+                if not postings:
+                    continue
+                idf = math.log((len(docs) + 1) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                scores[doc] = scores.get(doc, 0.0) + tf * idf
+        return scores
+
+    def ranked_scores(
+        self,
+        query_tokens: Iterable[str],
+        decay_lambda: float,
+        now: float,
+        docs: Optional[Collection[int]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[float, int]]:
+        """[(final score, doc)] for docs with a positive TF-IDF score.
+
+        final = tfidf * exp(-decay_lambda * days_old) * importance / 3, with
+        days_old taken as 0 for entries without a usable timestamp. now is a
+        POSIX timestamp. Order is unspecified. With limit, only the best
+        limit are guaranteed to be included (ties broken by doc order).
+        """
+        query_tokens = [qt for qt in query_tokens if qt in self.postings]
+        if np is not None and sum(len(self.postings[qt]) for qt in query_tokens) >= _NUMPY_MIN_HITS:
+            return self._ranked_numpy(query_tokens, decay_lambda, now, docs, limit)
+        times, weights = self.times, self.weights
+        scores = self.scores(query_tokens, docs).items()
+        if decay_lambda <= 0:
+            return [(score * weights[doc], doc) for doc, score in scores if score > 0]
+        exp = math.exp
+        ranked = []
+        for doc, score in scores:
+            if score <= 0:
+                continue
+            t = times[doc]
+            days_old = 0.0 if t != t else (now - t) / 86400.0
+            ranked.append((score * exp(-decay_lambda * days_old) * weights[doc], doc))
+        return ranked
+
+    def top_docs(
+        self,
+        query_tokens: Iterable[str],
+        decay_lambda: float,
+        now: float,
+        limit: int,
+        docs: Optional[Collection[int]] = None,
+    ) -> List[int]:
+        """The best `limit` docs by ranked_scores(), best first.
+
+        Ties keep store order, like a stable sort would.
+        """
+        scored = self.ranked_scores(query_tokens, decay_lambda, now, docs, limit)
+        top = heapq.nlargest(limit, scored, key=lambda x: (x[0], -x[1]))
+        return [doc for _, doc in top]
+
+    def _posting_arrays(self, token: str):
+        """(docs, tfs) int64 arrays of a token's postings, cached until the next edit."""
+        cached = self._token_arrays.get(token)
+        if cached is not None and cached[0] == self._version:
+            return cached[1], cached[2]
+        pairs = np.array(self.postings[token], dtype=np.int64).reshape(-1, 2)
+        d, tf = pairs[:, 0], pairs[:, 1]
+        self._token_arrays[token] = (self._version, d, tf)
+        return d, tf
+
+    def _ranked_numpy(self, query_tokens, decay_lambda, now, docs, limit):
+        """ranked_scores() with the same arithmetic done on arrays."""
+        subset = None if docs is None else np.fromiter(docs, dtype=np.int64, count=len(docs))
+        doc_parts, weight_parts = [], []
+        for qt in query_tokens:
+            d, tf = self._posting_arrays(qt)
+            if subset is None:
+                idf = self.idf(qt)
+            else:
+                mask = np.isin(d, subset)
+                d, tf = d[mask], tf[mask]
+                if not len(d):
+                    continue
+                idf = math.log((len(subset) + 1) / (len(d) + 0.5))
+            doc_parts.append(d)
+            weight_parts.append(tf * idf)
+        if not doc_parts:
+            return []
+        if self._arrays is None or len(self._arrays[0]) != len(self.times):
+            self._arrays = (np.array(self.times), np.array(self.weights))
+        times, weights = self._arrays
+        all_docs = np.concatenate(doc_parts)
+        all_weights = np.concatenate(weight_parts)
+
+        if numba is not None and len(all_docs) >= _NUMBA_MIN_HITS:
+            doc, final = _jit_final_scores()(all_docs, all_weights, times, weights, now, decay_lambda)
+        else:
+            # Per-doc sums, added in query token order like scores()
+            doc, inverse = np.unique(all_docs, return_inverse=True)
+            score = np.bincount(inverse.ravel(), weights=all_weights)
+            keep = score > 0
+            doc, score = doc[keep], score[keep]
+            if decay_lambda > 0:
+                days_old = np.nan_to_num((now - times[doc]) / 86400.0, nan=0.0)
+                score = score * np.exp(-decay_lambda * days_old)
+            final = score * weights[doc]
+
+        if limit is not None and 0 < limit < len(final):
+            # Everything above the limit-th best score, then the earliest docs at it
+            cut = -np.partition(-final, limit - 1)[limit - 1]
+            above = np.flatnonzero(final > cut)
+            at = np.flatnonzero(final == cut)[: limit - len(above)]
+            picked = np.concatenate([above, at])
+            doc, final = doc[picked], final[picked]
+        return list(zip(final.tolist(), doc.tolist()))
+
+
+def _final_scores(docs, tf_idf, times, weights, now, decay_lambda):
+    """Single-pass version of the unique/bincount scoring, for numba.
+
+    Sums tf_idf per doc into a dense array in input order, then applies
+    decay and importance to the docs with a positive sum, in doc order.
+    Plain numpy code, so it also runs (slowly) without being jitted.
+    """
+    acc = np.zeros(times.shape[0])
+    for i in range(docs.shape[0]):
+        acc[docs[i]] += tf_idf[i]
+    count = 0
+    for d in range(acc.shape[0]):
+        if acc[d] > 0:
+            count += 1
+    out_doc = np.empty(count, dtype=np.int64)
+    out = np.empty(count)
+    j = 0
+    for d in range(acc.shape[0]):
+        score = acc[d]
+        if score > 0:
+            if decay_lambda > 0:
+                t = times[d]
+                days_old = 0.0 if np.isnan(t) else (now - t) / 86400.0
+                score = score * np.exp(-decay_lambda * days_old)
+            out_doc[j] = d
+            out[j] = score * weights[d]
+            j += 1
+    return out_doc, out
+
+
+_jitted_final_scores = None
+
+
+def _jit_final_scores():
+    """_final_scores compiled with numba on first use (cached on disk)."""
+    global _jitted_final_scores
+    if _jitted_final_scores is None:
+        _jitted_final_scores = numba.njit(cache=True)(_final_scores)
+    return _jitted_final_scores
+
+
+# Sidecar of memories.jsonl: the KeywordIndex of its entries, so a new
+# process can skip re-tokenizing the store. Safe to delete.
+INDEX_FILE = "memories.index"
+_INDEX_VERSION = 5
+_CRC_CHUNK = 1 << 20
+# Version 2 sidecar, JSON throughout; removed when the binary one is written
+_OLD_INDEX_FILE = "memories.index.json"
+
+# Sidecar layout: one JSON header line (version, source, crc, tags, ids and
+# the section sizes), then raw machine arrays, in this order:
+#   tokens   UTF-8, "\n"-joined (tokens are \w+ runs, so never contain "\n")
+#   offsets  int64[tokens + 1], each token's slice of the two posting arrays
+#   docs     int64[postings]
+#   tfs      int64[postings]
+#   doc_len  int64[docs]
+#   times    float64[docs], NaN if unknown
+#   weights  float64[docs]
+# Loading is a few memcpys plus building the posting tuples, instead of
+# parsing millions of JSON lists.
+_ARRAYS = (("offsets", "q"), ("docs", "q"), ("tfs", "q"), ("doc_len", "q"), ("times", "d"), ("weights", "d"))
+
+
+def _index_path(memories_path: Path) -> Path:
+    return memories_path.with_name(INDEX_FILE)
+
+
+def drop_index_file(memories_path: Path):
+    """Remove the sidecar. Call after rewriting memories.jsonl in place."""
+    for name in (INDEX_FILE, _OLD_INDEX_FILE):
+        try:
+            os.remove(memories_path.with_name(name))
+        except OSError:
+            pass
+
+
+def _encode_state(state: dict) -> bytes:
+    """Binary sidecar bytes for a KeywordIndex.state() plus version/source/crc."""
+    postings = state["postings"]
+    cols = {name: array(code) for name, code in _ARRAYS}
+    offsets, docs, tfs = cols["offsets"], cols["docs"], cols["tfs"]
+    offsets.append(0)
+    for plist in postings.values():
+        if plist:
+            d, tf = zip(*plist)
+            docs.extend(d)
+            tfs.extend(tf)
+        offsets.append(len(docs))
+    cols["doc_len"].extend(state["doc_len"])
+    cols["times"].extend(math.nan if t is None else t for t in state["times"])
+    cols["weights"].extend(state["weights"])
+    tokens = "\n".join(postings).encode("utf-8")
+    header = {
+        "version": state["version"],
+        "source": state["source"],
+        "crc": state["crc"],
+        "tags": state["tags"],
+        "ids": state["ids"],
+        "byteorder": sys.byteorder,
+        "tokens": len(tokens),
+        "lengths": [len(cols[name]) for name, _ in _ARRAYS],
+    }
+    parts = [dumps_line(header), tokens]
+    parts.extend(cols[name].tobytes() for name, _ in _ARRAYS)
+    return b"".join(parts)
+
+
+def _decode_state(data: bytes) -> dict:
+    """Inverse of _encode_state(). Raises ValueError on anything malformed."""
+    end = data.find(b"\n")
+    header = loads(data[:end]) if end >= 0 else None
+    if not isinstance(header, dict) or header.get("version") != _INDEX_VERSION:
+        raise ValueError("not a current index sidecar")
+    try:
+        pos = end + 1
+        size = header["tokens"]
+        tokens = data[pos:pos + size].decode("utf-8").split("\n") if size else []
+        pos += size
+        cols = {}
+        for (name, code), n in zip(_ARRAYS, header["lengths"]):
+            col = array(code)
+            size = n * col.itemsize
+            col.frombytes(data[pos:pos + size])
+            if len(col) != n:
+                raise ValueError("truncated index sidecar")
+            if header["byteorder"] != sys.byteorder:
+                col.byteswap()
+            cols[name] = col
+            pos += size
+        offsets, docs, tfs = cols["offsets"], cols["docs"], cols["tfs"]
+        n = len(cols["doc_len"])
+        if (
+            pos != len(data)
+            or len(offsets) != len(tokens) + 1
+            or offsets[0] != 0
+            or offsets[-1] != len(docs)
+            or len(tfs) != len(docs)
+            or not len(cols["times"]) == len(cols["weights"]) == len(header["tags"]) == len(header["ids"]) == n
+        ):
+            raise ValueError("malformed index sidecar")
+        postings = {}
+        for i, token in enumerate(tokens):
+            a, b = offsets[i], offsets[i + 1]
+            postings[token] = list(zip(docs[a:b], tfs[a:b]))
+        return {
+            "source": header["source"],
+            "crc": header["crc"],
+            "tags": header["tags"],
+            "ids": header["ids"],
+            "postings": postings,
+            "doc_len": cols["doc_len"].tolist(),
+            "times": [None if t != t else t for t in cols["times"]],
+            "weights": cols["weights"].tolist(),
+        }
+    except (KeyError, TypeError, IndexError) as e:
+        raise ValueError("malformed index sidecar") from e
+
+
+def load_index(memories_path: Path, entries: List[dict], key: Tuple[int, int]) -> KeywordIndex:
+    """KeywordIndex over entries, the live entries of memories_path at stat key.
+
+    Reuses the sidecar when it was written for this exact file, or for a
+    prefix of it (same CRC-32) that has since only had records appended
+    (memories.jsonl is append-only between rewrites, and rewrites drop the
+    sidecar). Otherwise builds the index from scratch. The sidecar is
+    rewritten after a rebuild, or once a reused one has fallen noticeably
+    behind.
+    """
+    index, behind = _read_index_file(memories_path, entries, key)
+    if index is None:
+        index = KeywordIndex(entries)
+        behind = len(index) + 1
+    if behind > len(index) // 8:
+        _write_index_file(memories_path, index, key)
+    return index
+
+
+def _read_index_file(
+    memories_path: Path, entries: List[dict], key: Tuple[int, int]
+) -> Tuple[Optional[KeywordIndex], int]:
+    """(sidecar index caught up with entries, records it was behind by).
+
+    The index is None if the sidecar is missing or can't be trusted.
+    """
+    try:
+        state = _decode_state(_index_path(memories_path).read_bytes())
+    except (OSError, ValueError):
+        return None, 0
+    source = state.get("source")
+    if source == list(key):
+        index = KeywordIndex.from_state(state)
+        return (index, 0) if index.bind(entries) else (None, 0)
+    # Written for a shorter file: check it is our prefix and replay the rest
+    size = source[1] if isinstance(source, list) and len(source) == 2 else None
+    if not isinstance(size, int) or not 0 < size < key[1]:
+        return None, 0
+    try:
+        with open(memories_path, "rb") as f:
+            # Hashing the prefix is far cheaper than re-tokenizing it, and
+            # catches same-length edits that a look at its end would miss
+            if _prefix_crc(f, size) != state.get("crc"):
+                return None, 0
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                return None, 0
+            added = f.read(key[1] - size)
+    except OSError:
+        return None, 0
+    index = KeywordIndex.from_state(state)
+    behind = 0
+    for raw in added.split(b"\n"):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            rec = loads(raw)
+        except ValueError:
+            return None, 0
+        if not isinstance(rec, dict):
+            return None, 0
+        behind += 1
+        if rec.get(DELETED):
+            index.remove(rec.get("id"))
+        elif TAG_PATCH in rec:
+            doc = index.first_doc(rec.get("id"))
+            if doc is not None:
+                patch = rec[TAG_PATCH]
+                index.retag(doc, patch_tags(index.tags[doc], patch.get("add"), patch.get("remove")))
+        else:
+            index.add(rec)
+    index.sweep()
+    if not index.bind(entries):
+        return None, 0
+    return index, behind
+
+
+def _prefix_crc(f: BinaryIO, size: int) -> Optional[int]:
+    """CRC-32 of the first size bytes of f, or None if f is shorter."""
+    f.seek(0)
+    crc = 0
+    while size > 0:
+        chunk = f.read(min(size, _CRC_CHUNK))
+        if not chunk:
+            return None
+        crc = zlib.crc32(chunk, crc)
+        size -= len(chunk)
+    return crc
+
+
+def _write_index_file(memories_path: Path, index: KeywordIndex, key: Tuple[int, int]):
+    """Best-effort write of the sidecar; it is only a cache."""
+    path = _index_path(memories_path)
+    try:
+        with open(memories_path, "rb") as f:
+            crc = _prefix_crc(f, key[1])
+        if crc is None:
+            return  # Shorter than when it was parsed: rewritten since
+        state = index.state()
+        state.update(version=_INDEX_VERSION, source=list(key), crc=crc)
+        tmp = path.with_name(INDEX_FILE + ".tmp")
+        tmp.write_bytes(_encode_state(state))
+        os.replace(tmp, path)
+    except OSError:
+        return
+    try:
+        os.remove(memories_path.with_name(_OLD_INDEX_FILE))
+    except OSError:
+        pass
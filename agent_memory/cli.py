@@ -36,6 +36,7 @@ def main():
         dest="fmt",
         help=f"Export format (default: {config.get('default_export_format', 'md')})",
     )
+    p_export.add_argument("-o", "--output", default=None, help="Write to this file instead of stdout")
 
     p_delete = sub.add_parser("delete", help="Delete a memory by ID")
     p_delete.add_argument("id", help="Memory ID to delete")
@@ -46,8 +47,10 @@ def main():
     p_tag.add_argument("--add", dest="add_tags", default="", help="Comma-separated tags to add")
     p_tag.add_argument("--remove", dest="remove_tags", default="", help="Comma-separated tags to remove")
 
+    sub.add_parser("compact", help="Rewrite the store without deleted or superseded records")
     sub.add_parser("config", help="Show current configuration")
-    sub.add_parser("rebuild-vectors", help="Rebuild vector embeddings for all memories")
+    p_rebuild = sub.add_parser("rebuild-vectors", help="Rebuild vector embeddings for all memories")
+    p_rebuild.add_argument("--missing", action="store_true", help="Only embed memories without a vector")
 
     args = parser.parse_args()
 
@@ -63,14 +66,10 @@ def main():
                     meta[k.strip()] = v.strip()
         store.add_memory(args.text, tags=tags, metadata=meta, importance=args.importance)
     elif args.command == "search":
-        from .sdk import Memory
-        mem = Memory()
+        mem = _memory(config)
         max_results = args.n if args.n is not None else config.get("max_results", 10)
         if args.tag and not args.query:
             results = mem.search("", limit=max_results, tag=args.tag, mode="keyword")
-            if not results:
-                entries = mem.list(limit=9999)
-                results = [e for e in entries if args.tag in e.get("tags", [])][:max_results]
         elif not args.query:
             print("Error: query is required unless --tag is specified.")
             sys.exit(1)
@@ -82,7 +81,13 @@ def main():
         _print_entries(entries)
     elif args.command == "export":
         fmt = args.fmt or config.get("default_export_format", "md")
-        print(store.export_memories(fmt))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                store.stream_export_memories(fmt, f)
+            print(f"Exported to {args.output}")
+        else:
+            store.stream_export_memories(fmt, sys.stdout)
+            print()
     elif args.command == "delete":
         if not args.force:
             confirm = input(f"Delete memory {args.id}? [y/N] ").strip().lower()
@@ -106,21 +111,35 @@ def main():
         else:
             print(f"Memory {args.id} not found.")
             sys.exit(1)
+    elif args.command == "compact":
+        dropped = _memory(config).compact()
+        print(f"Compacted store, dropped {dropped} records.")
     elif args.command == "config":
         import json
         print(json.dumps(config, indent=2, ensure_ascii=False))
     elif args.command == "rebuild-vectors":
-        from .sdk import Memory
-        mem = Memory()
-        count = mem.rebuild_vectors()
+        mem = _memory(config)
+        count = mem.rebuild_vectors(missing_only=args.missing)
         if count > 0:
             print(f"Rebuilt vectors for {count} memories.")
+        elif args.missing and mem.vectors.enabled:
+            print("All memories already have vectors.")
         else:
             print("No vectors built. Check embedding config in .agent-memory/config.json")
     else:
         parser.print_help()
 
 
+def _memory(config):
+    """Memory on the store the other commands use (found by walking up from cwd)."""
+    from .sdk import Memory
+    d = store._root()
+    if not d.is_dir():
+        print("Not initialized. Run `agent-memory init` first.")
+        sys.exit(1)
+    return Memory(config={**config, "store_path": str(d.absolute())})
+
+
 def _print_entries(entries):
     if not entries:
         print("No memories found.")
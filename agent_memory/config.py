@@ -1,7 +1,9 @@
 """Configuration management for agent-memory."""
 import json
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
+
+from ._files import stat_key
 
 STORE_DIR = ".agent-memory"
 CONFIG_FILE = "config.json"
@@ -14,30 +16,63 @@ DEFAULT_CONFIG = {
     "time_decay_lambda": 0.01,
 }
 
+# cwd -> resolved config.json. Only hits are cached; misses re-walk.
+_PATH_CACHE: Dict[Path, Path] = {}
+# config.json -> ((mtime_ns, size), parsed user config)
+_CFG_CACHE: Dict[Path, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+
+
+def invalidate_config_cache():
+    """Forget cached config paths and parsed configs."""
+    _PATH_CACHE.clear()
+    _CFG_CACHE.clear()
+
 
 def _find_config_path() -> Optional[Path]:
     """Walk up to find .agent-memory/config.json, return its parent or None."""
-    p = Path.cwd()
+    cwd = Path.cwd()
+    cached = _PATH_CACHE.get(cwd)
+    if cached is not None and cached.is_file():
+        return cached
+    p = cwd
     while p != p.parent:
         cfg = p / STORE_DIR / CONFIG_FILE
         if cfg.exists():
+            _PATH_CACHE[cwd] = cfg
             return cfg
         p = p.parent
-    cfg = Path.cwd() / STORE_DIR / CONFIG_FILE
-    return cfg if cfg.exists() else None
+    cfg = cwd / STORE_DIR / CONFIG_FILE
+    if cfg.exists():
+        _PATH_CACHE[cwd] = cfg
+        return cfg
+    return None
+
+
+def _load_user_config(cfg_path: Path) -> Dict[str, Any]:
+    """Parse config.json, reusing the last parse if the file is unchanged."""
+    key = stat_key(cfg_path)
+    if key is None:
+        return {}
+    cached = _CFG_CACHE.get(cfg_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    user_cfg: Dict[str, Any] = {}
+    try:
+        parsed = json.loads(cfg_path.read_text())
+        if isinstance(parsed, dict):
+            user_cfg = parsed
+    except (json.JSONDecodeError, OSError):
+        pass  # Fall back to defaults on corrupt config
+    _CFG_CACHE[cfg_path] = (key, user_cfg)
+    return user_cfg
 
 
 def load_config() -> Dict[str, Any]:
     """Load config from .agent-memory/config.json, merged with defaults."""
     cfg_path = _find_config_path()
     config = dict(DEFAULT_CONFIG)
-    if cfg_path and cfg_path.exists():
-        try:
-            user_cfg = json.loads(cfg_path.read_text())
-            if isinstance(user_cfg, dict):
-                config.update(user_cfg)
-        except (json.JSONDecodeError, OSError):
-            pass  # Fall back to defaults on corrupt config
+    if cfg_path:
+        config.update(_load_user_config(cfg_path))
     return config
 
 
@@ -51,6 +86,8 @@ def save_config(config: Dict[str, Any], target_dir: Optional[Path] = None) -> Pa
             target_dir = cfg_path.parent
     path = target_dir / CONFIG_FILE
     path.write_text(json.dumps(config, indent=2, ensure_ascii=False) + "\n")
+    # A new config may now be closer to some cwd than a cached one
+    _PATH_CACHE.clear()
     return path
 
 
@@ -1,6 +1,8 @@
 """Optional vector embeddings via OpenAI-compatible API.
 
-Requires no extra dependencies — uses urllib from stdlib.
+Requires no extra dependencies — uses http.client/urllib from stdlib, with
+keep-alive connections reused across calls. If numpy is installed,
+similarity scoring is vectorized over all stored vectors.
 Configure via .agent-memory/config.json:
 
 {
@@ -17,14 +19,46 @@ Or set environment variables:
     AGENT_MEMORY_EMBEDDING_MODEL
 """
 
-import json
+import heapq
+import http.client
 import math
+import operator
 import os
+import threading
+import urllib.error
+import urllib.parse
 import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import compress, repeat
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
+from ._files import DELETED, dumps_line, iter_lines, loads, stat_key
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional
+    np = None
+
+try:
+    import simsimd
+except ImportError:  # simsimd is optional, and only used together with numpy
+    simsimd = None
+
+try:
+    import numba
+except ImportError:  # numba is optional, and only used together with numpy
+    numba = None
+
+# Append-only like memories.jsonl: {"id", "vector"} lines, and
+# {"id": ..., "_del": true} once a memory's vector is deleted
 VECTORS_FILE = "vectors.jsonl"
+# numpy-only cache of vectors.jsonl: unit-norm float32 rows + their ids
+MATRIX_FILE = "vectors.npy"
+MATRIX_IDS_FILE = "vectors.ids.json"
+# Optional coarse index over the matrix rows: centroids + id -> list
+IVF_FILE = "vectors.ivf.npz"
 
 
 def _get_embedding_config(config: dict) -> Optional[dict]:
@@ -39,6 +73,66 @@ def _get_embedding_config(config: dict) -> Optional[dict]:
     return {"api_base": api_base.rstrip("/"), "api_key": api_key, "model": model}
 
 
+# Per-thread keep-alive connections, keyed by (scheme, netloc)
+_local = threading.local()
+
+
+def _connection(scheme: str, netloc: str) -> Tuple[http.client.HTTPConnection, bool]:
+    """Return (connection, reused) for host, opening one if needed."""
+    conns: Dict[Tuple[str, str], http.client.HTTPConnection] = _local.__dict__.setdefault("conns", {})
+    conn = conns.get((scheme, netloc))
+    if conn is not None:
+        return conn, True
+    cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+    conn = conns[(scheme, netloc)] = cls(netloc, timeout=30)
+    return conn, False
+
+
+def _drop_connection(scheme: str, netloc: str):
+    conn = _local.__dict__.get("conns", {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def _uses_proxy(parts: urllib.parse.SplitResult) -> bool:
+    if parts.scheme not in urllib.request.getproxies():
+        return False
+    return not urllib.request.proxy_bypass(parts.hostname or "")
+
+
+def _post(url: str, payload: bytes, headers: Dict[str, str]) -> bytes:
+    """POST payload and return the response body, raising on HTTP errors.
+
+    Reuses a keep-alive connection per host so repeated embedding calls
+    skip the TCP/TLS handshake. Proxied URLs go through urllib instead.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or _uses_proxy(parts):
+        req = urllib.request.Request(url, data=payload, headers=headers)
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.read()
+
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    while True:
+        conn, reused = _connection(parts.scheme, parts.netloc)
+        try:
+            conn.request("POST", path, body=payload, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+        except (http.client.HTTPException, OSError):
+            _drop_connection(parts.scheme, parts.netloc)
+            if reused:
+                continue  # Server closed an idle connection; retry on a fresh one
+            raise
+        if resp.will_close:
+            _drop_connection(parts.scheme, parts.netloc)
+        if resp.status >= 400:
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+        return body
+
+
 def get_embeddings(texts: List[str], config: dict) -> Optional[List[List[float]]]:
     """Get embeddings for a list of texts. Returns None if not configured."""
     emb_config = _get_embedding_config(config)
@@ -46,23 +140,18 @@ def get_embeddings(texts: List[str], config: dict) -> Optional[List[List[float]]
         return None
 
     url = f"{emb_config['api_base']}/embeddings"
-    payload = json.dumps({
+    payload = dumps_line({
         "input": texts,
         "model": emb_config["model"],
-    }).encode("utf-8")
+    })
 
-    req = urllib.request.Request(
-        url,
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {emb_config['api_key']}",
-        },
-    )
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {emb_config['api_key']}",
+    }
 
     try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            data = json.loads(resp.read())
+        data = loads(_post(url, payload, headers))
         # Sort by index to ensure order matches input
         sorted_data = sorted(data["data"], key=lambda x: x["index"])
         return [item["embedding"] for item in sorted_data]
@@ -70,16 +159,343 @@ def get_embeddings(texts: List[str], config: dict) -> Optional[List[List[float]]
         return None
 
 
+# (api_base, model, text) -> query embedding, least recently used first
+_query_cache: "OrderedDict[Tuple[str, str, str], Tuple[float, ...]]" = OrderedDict()
+_QUERY_CACHE_SIZE = 1024
+_query_lock = threading.Lock()
+
+
+def embed_query(text: str, config: dict) -> Optional[Tuple[float, ...]]:
+    """Embedding of one search query, memoized per endpoint and model.
+
+    Repeated queries skip the API round trip. Failed calls aren't cached.
+    """
+    emb_config = _get_embedding_config(config)
+    if not emb_config:
+        return None
+    key = (emb_config["api_base"], emb_config["model"], text)
+    with _query_lock:
+        vec = _query_cache.get(key)
+        if vec is not None:
+            _query_cache.move_to_end(key)
+            return vec
+    result = get_embeddings([text], config)
+    if not result:
+        return None
+    vec = tuple(result[0])
+    with _query_lock:
+        _query_cache[key] = vec
+        if len(_query_cache) > _QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+    return vec
+
+
 def cosine_similarity(a: List[float], b: List[float]) -> float:
-    """Pure Python cosine similarity. No numpy needed."""
-    dot = sum(x * y for x, y in zip(a, b))
-    norm_a = math.sqrt(sum(x * x for x in a))
-    norm_b = math.sqrt(sum(x * x for x in b))
+    """Cosine similarity of two vectors (lists or numpy arrays).
+
+    Uses simsimd's SIMD kernel on float32 when installed, numpy otherwise,
+    pure Python without numpy. Zero vectors have similarity 0. Vectors of
+    different lengths (e.g. from another embedding model) are compared like
+    zip() pairs them: dot product over the shared dimensions, full norms.
+    """
+    if np is not None:
+        if simsimd is not None:
+            va = np.asarray(a, dtype=np.float32)
+            vb = np.asarray(b, dtype=np.float32)
+            # simsimd gives 2 zero vectors distance 0; keep numpy's answer for them
+            if va.ndim == 1 and va.shape == vb.shape and va.any() and vb.any():
+                return 1.0 - float(simsimd.cosine(va, vb))
+        va = np.asarray(a, dtype=np.float64)
+        vb = np.asarray(b, dtype=np.float64)
+        norm = float(np.linalg.norm(va)) * float(np.linalg.norm(vb))
+        if norm == 0:
+            return 0.0
+        if va.shape != vb.shape:
+            va, vb = va[:len(vb)], vb[:len(va)]
+        return float(np.dot(va, vb)) / norm
+    # map/hypot keep the loops in C
+    dot = sum(map(operator.mul, a, b))
+    norm_a = math.hypot(*a)
+    norm_b = math.hypot(*b)
     if norm_a == 0 or norm_b == 0:
         return 0.0
     return dot / (norm_a * norm_b)
 
 
+def _normalize_rows(mat):
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (mat / norms).astype(np.float32, copy=False)
+
+
+def _quantize_rows(mat):
+    """(int8 rows, float32 per-row scale) with rows ~= int8 rows * scale.
+
+    Each row is scaled so its largest component maps to +-127.
+    """
+    amax = np.abs(mat).max(axis=1) if mat.shape[1] else np.zeros(mat.shape[0], dtype=np.float32)
+    amax[amax == 0] = 1.0
+    scale = (amax / 127.0).astype(np.float32)
+    return np.rint(mat / scale[:, None]).astype(np.int8), scale
+
+
+def _encode_rows(mat, storage: str):
+    """(rows, per-row scale or None) of unit-norm float32 rows in `storage` form."""
+    if storage == "int8":
+        return _quantize_rows(mat)
+    if storage == "binary":
+        # Sign bits, 8 dimensions per byte
+        return np.packbits(mat > 0, axis=1), None
+    return mat, None
+
+
+# Rows converted to float32 per step when scanning int8 rows without simsimd,
+# or when assigning rows to IVF lists
+_ROW_CHUNK = 8192
+
+
+def _pick_kernel(usable: Dict[str, bool]) -> str:
+    """Name of the scoring backend to use, out of usable (in preference order).
+
+    AGENT_MEMORY_KERNEL picks one if it is usable; otherwise the first usable.
+    """
+    forced = os.environ.get("AGENT_MEMORY_KERNEL", "")
+    if usable.get(forced):
+        return forced
+    return next(name for name, ok in usable.items() if ok)
+
+
+def _simsimd_cdist() -> bool:
+    return simsimd is not None and hasattr(simsimd, "cdist")
+
+
+def _int8_cosines(mat8, scale, q):
+    """Cosines of unit-norm float32 q with the unit rows mat8 * scale approximates.
+
+    numba is preferred (no temporaries, no query rounding), then simsimd.
+    """
+    out = np.empty(mat8.shape[0], dtype=np.float32)
+    if not mat8.shape[0]:
+        return out
+    kernel = _pick_kernel({"numba": numba is not None, "simsimd": _simsimd_cdist(), "numpy": True})
+    if kernel == "numba":
+        _jit_int8_dots()(mat8, q, scale, out)
+        return out
+    if kernel == "simsimd":
+        q8, _ = _quantize_rows(q[None, :])
+        dist = np.asarray(simsimd.cdist(q8, mat8, metric="cosine"), dtype=np.float32)
+        return 1.0 - dist.reshape(-1)
+    for i in range(0, mat8.shape[0], _ROW_CHUNK):
+        out[i:i + _ROW_CHUNK] = mat8[i:i + _ROW_CHUNK].astype(np.float32) @ q
+    return out * scale
+
+
+def _binary_cosines(bits, q, dim: int):
+    """Cosines of q with the rows whose sign bits are `bits`, estimated from
+    their Hamming distance h as cos(pi * h / dim)."""
+    if not bits.shape[0]:
+        return np.empty(0, dtype=np.float32)
+    qb = np.packbits(q > 0)
+    if _pick_kernel({"simsimd": _simsimd_cdist(), "numpy": True}) == "simsimd":
+        dist = np.asarray(simsimd.cdist(qb[None, :], bits, metric="hamming", dtype="bin8")).reshape(-1)
+    else:
+        x = bits ^ qb
+        if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+            if x.shape[1] % 8 == 0:
+                x = x.view(np.uint64)
+            dist = np.bitwise_count(x).sum(axis=1, dtype=np.int64)
+        else:
+            dist = np.unpackbits(x, axis=1).sum(axis=1, dtype=np.int64)
+    return np.cos(dist * (np.pi / dim)).astype(np.float32)
+
+
+def _int8_dots(mat8, q, scale, out):
+    """out[i] = (mat8[i] @ q) * scale[i], one row at a time, for numba.
+
+    Accumulates in float32 without converting rows to a float copy.
+    Plain numpy code, so it also runs (slowly) without being jitted.
+    """
+    for i in range(mat8.shape[0]):
+        s = np.float32(0.0)
+        for j in range(mat8.shape[1]):
+            s += mat8[i, j] * q[j]
+        out[i] = s * scale[i]
+
+
+_jitted_int8_dots = None
+
+
+def _jit_int8_dots():
+    """_int8_dots compiled with numba on first use (cached on disk)."""
+    global _jitted_int8_dots
+    if _jitted_int8_dots is None:
+        _jitted_int8_dots = numba.njit(cache=True, fastmath=True)(_int8_dots)
+    return _jitted_int8_dots
+
+
+class _IVFIndex:
+    """Inverted lists of matrix rows, one per k-means centroid.
+
+    Rows at positions >= covered were added after the index was built and
+    are candidates for every query.
+    """
+
+    def __init__(self, centroids, assign):
+        self.centroids = centroids
+        # assign[row] = list number, or -1 for rows the index doesn't know
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(-1, len(centroids) + 1))
+        self.lists = [order[bounds[i + 1]:bounds[i + 2]] for i in range(len(centroids))]
+        self.unassigned = order[bounds[0]:bounds[1]]
+        self.covered = len(assign)
+
+    def candidates(self, q, nprobe: int, n_rows: int):
+        """Boolean mask over n_rows: rows in the nprobe lists nearest q."""
+        mask = np.zeros(n_rows, dtype=bool)
+        mask[self.covered:] = True
+        mask[self.unassigned] = True
+        if nprobe >= len(self.lists):
+            mask[:self.covered] = True
+            return mask
+        near = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        for i in near.tolist():
+            mask[self.lists[i]] = True
+        return mask
+
+
+def _kmeans(m: "_VectorMatrix", nlist: int, iters: int = 10, sample: int = 64, seed: int = 0):
+    """Spherical k-means over the live rows of m: (centroids, assign).
+
+    Centroids are trained with Lloyd iterations on a sample of up to
+    sample * nlist rows, then every row is assigned to its nearest centroid.
+    """
+    live = np.fromiter((i for i, mid in enumerate(m.ids) if mid is not None), dtype=np.intp)
+    rng = np.random.default_rng(seed)
+    train = m.float_rows(np.sort(rng.choice(live, min(len(live), sample * nlist), replace=False)))
+    centroids = train[rng.choice(len(train), nlist, replace=False)]
+    for _ in range(iters):
+        labels = np.argmax(train @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, train)
+        empty = ~np.bincount(labels, minlength=nlist).astype(bool)
+        sums[empty] = train[rng.choice(len(train), int(empty.sum()))]
+        centroids = _normalize_rows(sums)
+    assign = np.full(len(m.ids), -1, dtype=np.int32)
+    for i in range(0, len(live), _ROW_CHUNK):
+        rows = live[i:i + _ROW_CHUNK]
+        assign[rows] = np.argmax(m.float_rows(rows) @ centroids.T, axis=1)
+    return centroids, assign
+
+
+class _VectorMatrix:
+    """Unit-norm rows of all stored vectors, plus an id -> row map.
+
+    Rows are kept in one of three storage forms: "float32"; "int8" with a
+    per-row scale (4x smaller, cosines accurate to about 1e-3); or "binary"
+    sign bits (32x smaller, cosines estimated from Hamming distance, so
+    rankings are coarse). Rows appended via add() are buffered and stacked
+    on the next read of .mat, so bulk inserts don't copy the matrix once
+    per vector. Rows dropped via remove() stay in the matrix, with id None,
+    until the matrix is next rebuilt.
+    """
+
+    def __init__(self, ids: List[Optional[str]], mat, scale=None, storage: str = "float32", dim: Optional[int] = None):
+        self.ids = list(ids)
+        self.rows = {mid: i for i, mid in enumerate(self.ids) if mid is not None}
+        self._mat = mat
+        # int8 storage only: float32 factor per row
+        self.scale = scale
+        self.storage = storage
+        # Vector length; binary rows pack 8 dimensions per byte
+        self._dim = mat.shape[1] if dim is None else dim
+        self._pending: list = []
+        self.ivf: Optional[_IVFIndex] = None
+        # Lines of vectors.jsonl the matrix reflects, and whether every live
+        # vector in it has a row (then rows alone answer membership)
+        self.records: Optional[int] = None
+        self.complete = False
+        # Leading rows that match the vectors.npy sidecar
+        self.on_disk = 0
+        # Bumped whenever the id -> row map changes
+        self.version = 0
+
+    @classmethod
+    def from_vectors(cls, vectors: dict, storage: str = "float32") -> Optional["_VectorMatrix"]:
+        """Build from an id -> vector dict. None if the vectors can't be stacked."""
+        ids = [mid for mid, vec in vectors.items() if vec]
+        if not ids:
+            return cls([], *_encode_rows(np.zeros((0, 0), dtype=np.float32), storage), storage=storage)
+        try:
+            mat = np.asarray([vectors[mid] for mid in ids], dtype=np.float32)
+        except ValueError:
+            return None  # Ragged, e.g. vectors from two different models
+        if mat.ndim != 2:
+            return None
+        return cls(ids, *_encode_rows(_normalize_rows(mat), storage), storage=storage, dim=mat.shape[1])
+
+    @property
+    def dim(self) -> int:
+        if self._pending:
+            return self._pending[0].shape[0]
+        return self._dim if self._mat.shape[0] else 0
+
+    @property
+    def mat(self):
+        if self._pending:
+            new = _normalize_rows(np.vstack(self._pending))
+            self._dim = new.shape[1]
+            new, scale = _encode_rows(new, self.storage)
+            if scale is not None:
+                self.scale = np.concatenate([self.scale, scale])
+            self._mat = np.concatenate([self._mat, new]) if self._mat.shape[0] else new
+            self._pending = []
+        return self._mat
+
+    def float_rows(self, idx):
+        """float32 copy of the rows at positions idx (unit-norm +-1 rows for binary)."""
+        rows = self.mat[idx]
+        if self.storage == "binary":
+            signs = np.unpackbits(rows, axis=1, count=self._dim).astype(np.float32) * 2 - 1
+            return signs / np.float32(math.sqrt(self._dim))
+        rows = np.asarray(rows, dtype=np.float32)
+        return rows * self.scale[idx, None] if self.scale is not None else rows
+
+    def cosines(self, q, idx):
+        """Cosines of unit-norm float32 q with the rows at positions idx."""
+        mat = self.mat
+        subset = len(idx) * 4 < mat.shape[0]
+        if self.storage == "float32":
+            return mat[idx] @ q if subset else (mat @ q)[idx]
+        rows = mat[idx] if subset else mat
+        if self.storage == "int8":
+            sims = _int8_cosines(rows, self.scale[idx] if subset else self.scale, q)
+        else:
+            sims = _binary_cosines(rows, q, self._dim)
+        return sims if subset else sims[idx]
+
+    def add(self, memory_id: str, vector: List[float]) -> bool:
+        """Append a row. Returns False if the matrix must be rebuilt instead."""
+        if memory_id in self.rows or not vector:
+            return False
+        row = np.asarray(vector, dtype=np.float32)
+        if row.ndim != 1 or (self.dim and row.shape[0] != self.dim):
+            return False
+        self.rows[memory_id] = len(self.ids)
+        self.ids.append(memory_id)
+        self._pending.append(row)
+        self.version += 1
+        return True
+
+    def remove(self, memory_id: str):
+        """Mark the row of memory_id dead."""
+        row = self.rows.pop(memory_id, None)
+        if row is not None:
+            self.ids[row] = None
+            self.version += 1
+        if self.records is not None:
+            self.records += 1
+
+
 class VectorStore:
     """Manages vector embeddings alongside the JSONL memory store."""
 
@@ -87,31 +503,230 @@ class VectorStore:
         self._store_dir = store_dir
         self._config = config
         self._vectors_path = store_dir / VECTORS_FILE
+        # ((mtime_ns, size) of vectors.jsonl, id -> vector)
+        self._cache: Optional[Tuple[Tuple[int, int], dict]] = None
+        # Lines in the file the cache was read from, dead ones included
+        self._records = 0
+        # id -> L2 norm of its cached vector, filled in by pure-Python search
+        self._norms: Dict[str, float] = {}
+        # Same key, stacked matrix (numpy only; None if vectors are ragged)
+        self._mat_cache: Optional[Tuple[Tuple[int, int], Optional[_VectorMatrix]]] = None
+        # (entries list, its length, matrix, matrix version, with_vec, rows)
+        # of the last _entry_rows() call
+        self._rows_cache: Optional[tuple] = None
+        # "float32" (default), "int8" or "binary" rows in the matrix and its sidecar
+        storage = config.get("embedding", {}).get("storage", "float32")
+        self._storage = storage if storage in ("int8", "binary") else "float32"
 
     @property
     def enabled(self) -> bool:
         return _get_embedding_config(self._config) is not None
 
-    def _load_vectors(self) -> dict:
-        """Load id -> vector mapping."""
-        if not self._vectors_path.exists():
+    def _cached_vectors(self) -> Optional[dict]:
+        """Return the cached mapping if vectors.jsonl is unchanged on disk."""
+        if self._cache is None:
+            return None
+        if stat_key(self._vectors_path) != self._cache[0]:
+            self._cache = None
+            return None
+        return self._cache[1]
+
+    def _vectors(self) -> dict:
+        """id -> vector mapping, shared with the cache. Do not mutate."""
+        cached = self._cached_vectors()
+        if cached is not None:
+            return cached
+        key = stat_key(self._vectors_path)
+        if key is None:
             return {}
         vectors = {}
-        for line in self._vectors_path.read_text().splitlines():
-            line = line.strip()
-            if line:
-                entry = json.loads(line)
+        records = 0
+        for line in iter_lines(self._vectors_path):
+            entry = loads(line)
+            records += 1
+            if entry.get(DELETED):
+                vectors.pop(entry["id"], None)
+            else:
                 vectors[entry["id"]] = entry["vector"]
+        self._cache = (key, vectors)
+        self._records = records
+        self._norms = {}
         return vectors
 
+    def _load_vectors(self) -> dict:
+        """Load id -> vector mapping."""
+        return dict(self._vectors())
+
     def _append_vector(self, memory_id: str, vector: List[float]):
-        with open(self._vectors_path, "a") as f:
-            f.write(json.dumps({"id": memory_id, "vector": vector}) + "\n")
+        self._append_vectors([(memory_id, vector)])
+
+    def _append_vectors(self, pairs: List[Tuple[str, List[float]]]):
+        """Append (id, vector) pairs in a single write."""
+        if not pairs:
+            return
+        old_key = stat_key(self._vectors_path)
+        with open(self._vectors_path, "ab") as f:
+            f.write(b"".join(dumps_line({"id": mid, "vector": vec}) for mid, vec in pairs))
+        key = stat_key(self._vectors_path)
+        for mid, _ in pairs:
+            self._norms.pop(mid, None)
+        if self._cache is not None and self._cache[0] == old_key:
+            self._cache[1].update(pairs)
+            self._cache = (key, self._cache[1])
+            self._records += len(pairs)
+        else:
+            self._cache = None
+        mc = self._mat_cache
+        if mc is not None and mc[0] == old_key and mc[1] is not None and all(mc[1].add(mid, vec) for mid, vec in pairs):
+            if mc[1].records is not None:
+                mc[1].records += len(pairs)
+            self._mat_cache = (key, mc[1])
+        else:
+            self._mat_cache = None
 
     def _save_vectors(self, vectors: dict):
-        with open(self._vectors_path, "w") as f:
+        with open(self._vectors_path, "wb") as f:
             for mid, vec in vectors.items():
-                f.write(json.dumps({"id": mid, "vector": vec}) + "\n")
+                f.write(dumps_line({"id": mid, "vector": vec}))
+        self._cache = (stat_key(self._vectors_path), dict(vectors))
+        self._records = len(vectors)
+        self._norms = {}
+        self._mat_cache = None
+
+    def _matrix(self) -> Optional[_VectorMatrix]:
+        """Stacked matrix of the current vectors, or None without numpy.
+
+        Loaded from the vectors.npy sidecar when it matches vectors.jsonl,
+        otherwise built from the parsed JSONL and written back as the sidecar.
+        """
+        if np is None:
+            return None
+        key = stat_key(self._vectors_path)
+        if key is None:
+            return None
+        mc = self._mat_cache
+        if mc is not None and mc[0] == key:
+            return mc[1]
+        m = self._load_matrix_file(key)
+        if m is None:
+            vectors = self._vectors()
+            if self._cache is not None:
+                key = self._cache[0]
+            m = _VectorMatrix.from_vectors(vectors, storage=self._storage)
+            if m is not None:
+                m.records = self._records
+                m.complete = len(m.rows) == len(vectors)
+                self._save_matrix_file(key, m)
+        if m is not None:
+            m.ivf = self._load_ivf(m)
+        self._mat_cache = (key, m)
+        return m
+
+    def _load_matrix_file(self, key: Tuple[int, int]) -> Optional[_VectorMatrix]:
+        try:
+            meta = loads((self._store_dir / MATRIX_IDS_FILE).read_bytes())
+            if meta.get("source") != list(key) or meta.get("storage", "float32") != self._storage:
+                return None
+            mat = np.load(self._store_dir / MATRIX_FILE, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if mat.ndim != 2 or mat.shape[0] != len(meta.get("ids", ())):
+            return None
+        if self._storage == "int8":
+            scale = np.asarray(meta.get("scale", ()), dtype=np.float32)
+            if mat.dtype != np.int8 or scale.shape != (mat.shape[0],):
+                return None
+            m = _VectorMatrix(meta["ids"], mat, scale, storage="int8")
+        elif self._storage == "binary":
+            dim = meta.get("dim")
+            if mat.dtype != np.uint8 or not isinstance(dim, int) or mat.shape[1] != (dim + 7) // 8:
+                return None
+            m = _VectorMatrix(meta["ids"], mat, storage="binary", dim=dim)
+        else:
+            m = _VectorMatrix(meta["ids"], mat)
+        m.records = meta.get("records")
+        m.complete = bool(meta.get("complete"))
+        m.on_disk = mat.shape[0]
+        return m
+
+    def _save_matrix_file(self, key: Tuple[int, int], m: _VectorMatrix, rows: bool = True):
+        """Best-effort write of the sidecar; it is only a cache.
+
+        With rows=False only vectors.ids.json is rewritten, for changes
+        that just mark rows dead.
+        """
+        mat_path = self._store_dir / MATRIX_FILE
+        ids_path = self._store_dir / MATRIX_IDS_FILE
+        try:
+            if rows:
+                tmp = mat_path.with_name(MATRIX_FILE + ".tmp")
+                with open(tmp, "wb") as f:
+                    np.save(f, np.ascontiguousarray(m.mat))
+                os.replace(tmp, mat_path)
+                m.on_disk = len(m.ids)
+            tmp = ids_path.with_name(MATRIX_IDS_FILE + ".tmp")
+            meta = {
+                "source": list(key),
+                "ids": m.ids,
+                "storage": m.storage,
+                "records": m.records,
+                "complete": m.complete,
+            }
+            if m.scale is not None:
+                meta["scale"] = m.scale.tolist()
+            if m.storage == "binary":
+                meta["dim"] = m.dim
+            tmp.write_bytes(dumps_line(meta))
+            os.replace(tmp, ids_path)
+        except OSError:
+            pass
+
+    def _load_ivf(self, m: _VectorMatrix) -> Optional[_IVFIndex]:
+        """IVF index over m's rows from the sidecar, or None."""
+        try:
+            with np.load(self._store_dir / IVF_FILE) as f:
+                centroids, ids, lists = f["centroids"], f["ids"].tolist(), f["lists"]
+        except (OSError, KeyError, ValueError):
+            return None
+        if centroids.ndim != 2 or centroids.shape[1] != m.dim or len(ids) != len(lists):
+            return None
+        known = dict(zip(ids, lists.tolist()))
+        assign = np.fromiter((known.get(mid, -1) for mid in m.ids), dtype=np.int32, count=len(m.ids))
+        return _IVFIndex(centroids.astype(np.float32), assign)
+
+    def build_ivf(self, nlist: Optional[int] = None, iters: int = 10) -> int:
+        """Cluster the stored vectors for approximate search. Returns nlist.
+
+        Vector search then scores only the rows in the `nprobe` lists
+        nearest the query (`embedding.nprobe` in config, default 8), plus
+        any vectors added since. nlist defaults to sqrt(N). Needs numpy;
+        returns 0 without it or when there are no vectors.
+        """
+        m = self._matrix()
+        if m is None:
+            return 0
+        n = len(m.rows)
+        nlist = min(n, nlist or int(math.sqrt(n)))
+        if nlist <= 0:
+            return 0
+        centroids, assign = _kmeans(m, nlist, iters)
+        live = assign >= 0
+        ids = np.array([mid for mid in m.ids if mid is not None])
+        tmp = self._store_dir / (IVF_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=centroids, ids=ids, lists=assign[live])
+        os.replace(tmp, self._store_dir / IVF_FILE)
+        m.ivf = _IVFIndex(centroids, assign)
+        return nlist
+
+    def _drop_ivf(self):
+        try:
+            os.remove(self._store_dir / IVF_FILE)
+        except FileNotFoundError:
+            pass
+        mc = self._mat_cache
+        if mc is not None and mc[1] is not None:
+            mc[1].ivf = None
 
     def embed_and_store(self, memory_id: str, text: str) -> bool:
         """Embed text and store vector. Returns True on success."""
@@ -121,47 +736,231 @@ class VectorStore:
         self._append_vector(memory_id, result[0])
         return True
 
+    def _embed_items(self, items: List[dict]) -> List[Tuple[str, List[float]]]:
+        """Embed {id, text} items in one API call. Returns (id, vector) pairs."""
+        result = get_embeddings([item["text"] for item in items], self._config)
+        if result is None:
+            return []
+        return [(item["id"], vector) for item, vector in zip(items, result)]
+
     def embed_batch(self, items: List[dict]) -> int:
         """Embed multiple memories. items: list of {id, text}. Returns count stored."""
         if not items:
             return 0
-        texts = [item["text"] for item in items]
-        result = get_embeddings(texts, self._config)
-        if result is None:
-            return 0
-        for item, vector in zip(items, result):
-            self._append_vector(item["id"], vector)
-        return len(items)
-
-    def search(self, query: str, entries: List[dict], limit: int = 10) -> List[dict]:
-        """Vector similarity search. Returns entries sorted by similarity."""
-        query_vec_result = get_embeddings([query], self._config)
-        if query_vec_result is None:
+        pairs = self._embed_items(items)
+        self._append_vectors(pairs)
+        return len(pairs)
+
+    def search(self, query: str, entries: List[dict], limit: int = 10, nprobe: Optional[int] = None) -> List[dict]:
+        """Vector similarity search. Returns entries sorted by similarity.
+
+        After build_ivf(), only the nprobe lists nearest the query are
+        scored (default: `embedding.nprobe` from config, or 8).
+        """
+        query_vec = embed_query(query, self._config)
+        if query_vec is None:
+            return []
+        if nprobe is None:
+            nprobe = self._config.get("embedding", {}).get("nprobe", 8)
+        sims, with_vec = self._similarities(query_vec, entries, nprobe)
+        if limit <= 0:
             return []
-        query_vec = query_vec_result[0]
-
-        vectors = self._load_vectors()
-        scored = []
-        for e in entries:
-            vec = vectors.get(e["id"])
-            if vec:
-                sim = cosine_similarity(query_vec, vec)
-                scored.append((sim, e))
-        scored.sort(key=lambda x: -x[0])
-        return [e for _, e in scored[:limit]]
+        if np is not None and isinstance(sims, np.ndarray):
+            # O(N) partial selection, then sort only the top `limit`
+            if limit < len(sims):
+                top = np.argpartition(-sims, limit - 1)[:limit]
+            else:
+                top = np.arange(len(sims))
+            top = top[np.lexsort((top, -sims[top]))]
+            return [with_vec[i] for i in top.tolist()]
+        scored = heapq.nlargest(limit, zip(sims, with_vec), key=lambda x: x[0])
+        return [e for _, e in scored]
+
+    def _score_entries(self, query_vec: List[float], entries: List[dict]) -> List[Tuple[float, dict]]:
+        """Cosine similarity of query_vec against every entry that has a vector."""
+        sims, with_vec = self._similarities(query_vec, entries)
+        if np is not None and isinstance(sims, np.ndarray):
+            sims = sims.tolist()
+        return list(zip(sims, with_vec))
+
+    def _similarities(self, query_vec: List[float], entries: List[dict], nprobe: int = 0) -> tuple:
+        """(similarities, entries that have a vector), aligned by position.
+
+        Similarities are a numpy array on the matrix path, a list otherwise.
+        With nprobe > 0 and an IVF index, entries outside the probed lists
+        are left out.
+        """
+        m = self._matrix()
+        if m is None or len(query_vec) != m.dim:
+            vectors = self._vectors()
+            with_vec = [e for e in entries if vectors.get(e["id"])]
+            if np is None:
+                return self._py_cosines(query_vec, with_vec, vectors), with_vec
+            return [cosine_similarity(query_vec, vectors[e["id"]]) for e in with_vec], with_vec
+
+        with_vec, idx = self._entry_rows(m, entries)
+        if not with_vec:
+            return [], []
+        q = np.asarray(query_vec, dtype=np.float32)
+        q_norm = float(np.linalg.norm(q))
+        if q_norm == 0:
+            return np.zeros(len(with_vec), dtype=np.float32), with_vec
+        q = q / q_norm
+        # Rows are unit-norm, so one (N, D) @ (D,) product gives all cosines
+        if nprobe > 0 and m.ivf is not None:
+            keep = m.ivf.candidates(q, nprobe, len(m.ids))[idx]
+            with_vec = [e for e, k in zip(with_vec, keep.tolist()) if k]
+            idx = idx[keep]
+        return m.cosines(q, idx), with_vec
+
+    def _entry_rows(self, m: _VectorMatrix, entries: List[dict]) -> tuple:
+        """(entries that have a row in m, their row positions). Do not mutate.
+
+        Remembered for the last entries list, so repeated searches over the
+        same unchanged list skip the per-entry id lookups.
+        """
+        rc = self._rows_cache
+        if rc is not None and rc[0] is entries and rc[1] == len(entries) and rc[2] is m and rc[3] == m.version:
+            return rc[4], rc[5]
+        ids = map(operator.itemgetter("id"), entries)
+        idx = np.fromiter(map(m.rows.get, ids, repeat(-1)), dtype=np.intp, count=len(entries))
+        keep = idx >= 0
+        with_vec = list(compress(entries, keep.tolist()))
+        idx = idx[keep]
+        self._rows_cache = (entries, len(entries), m, m.version, with_vec, idx)
+        return with_vec, idx
+
+    def _py_cosines(self, query_vec: List[float], with_vec: List[dict], vectors: dict) -> List[float]:
+        """Pure-Python cosines of query_vec with each entry's vector.
+
+        The query is normalized once and stored vector norms are memoized,
+        so each comparison is a single dot product.
+        """
+        q_norm = math.hypot(*query_vec)
+        if q_norm == 0:
+            return [0.0] * len(with_vec)
+        q = [x / q_norm for x in query_vec]
+        norms = self._norms
+        mul = operator.mul
+        sims = []
+        for e in with_vec:
+            mid = e["id"]
+            vec = vectors[mid]
+            norm = norms.get(mid)
+            if norm is None:
+                norm = norms[mid] = math.hypot(*vec)
+            sims.append(sum(map(mul, q, vec)) / norm if norm else 0.0)
+        return sims
 
     def delete(self, memory_id: str):
-        """Remove vector for a memory."""
-        vectors = self._load_vectors()
-        if memory_id in vectors:
-            del vectors[memory_id]
-            self._save_vectors(vectors)
-
-    def rebuild(self, entries: List[dict], batch_size: int = 100) -> int:
-        """Rebuild all vectors from scratch. Returns count embedded."""
-        self._save_vectors({})  # Clear
+        """Remove vector for a memory.
+
+        Appends a tombstone instead of rewriting vectors.jsonl, until dead
+        lines would outnumber live vectors.
+        """
+        if self._delete_row(memory_id):
+            return
+        vectors = self._vectors()
+        if memory_id not in vectors:
+            return
+        if self._records + 1 > 2 * (len(vectors) - 1):
+            live = dict(vectors)
+            del live[memory_id]
+            self._save_vectors(live)
+            return
+        old_key = self._cache[0]
+        with open(self._vectors_path, "ab") as f:
+            f.write(dumps_line({"id": memory_id, DELETED: True}))
+        key = stat_key(self._vectors_path)
+        del vectors[memory_id]
+        self._norms.pop(memory_id, None)
+        self._cache = (key, vectors)
+        self._records += 1
+        mc = self._mat_cache
+        if mc is not None and mc[0] == old_key and mc[1] is not None:
+            mc[1].remove(memory_id)
+            self._mat_cache = (key, mc[1])
+        else:
+            self._mat_cache = None
+
+    def _sidecar_matrix(self) -> Optional[_VectorMatrix]:
+        """The matrix, if its rows answer for vectors.jsonl without parsing it."""
+        if np is None or self._cached_vectors() is not None:
+            return None
+        m = self._matrix()
+        if self._cached_vectors() is not None or m is None or not m.complete:
+            return None
+        return m
+
+    def contains(self, memory_id: str) -> bool:
+        """Whether memory_id has a stored vector.
+
+        Answered from the vectors cache or the matrix sidecar when either
+        is current, so it only parses vectors.jsonl as a last resort.
+        """
+        m = self._sidecar_matrix()
+        if m is not None:
+            return memory_id in m.rows
+        return memory_id in self._vectors()
+
+    def _delete_row(self, memory_id: str) -> bool:
+        """delete() through the matrix sidecar, without parsing vectors.jsonl.
+
+        Returns False when the sidecar can't answer for the file; the
+        caller then falls back to the parsed vectors.
+        """
+        m = self._sidecar_matrix()
+        if m is None or m.records is None:
+            return False
+        if memory_id not in m.rows:
+            return True
+        if m.records + 1 > 2 * (len(m.rows) - 1):
+            return False  # Compaction needs the vectors themselves
+        with open(self._vectors_path, "ab") as f:
+            f.write(dumps_line({"id": memory_id, DELETED: True}))
+        key = stat_key(self._vectors_path)
+        m.remove(memory_id)
+        self._mat_cache = (key, m)
+        if m.on_disk == len(m.ids):
+            # Only an id changed to None, so the rows on disk still match
+            self._save_matrix_file(key, m, rows=False)
+        return True
+
+    def rebuild(
+        self,
+        entries: List[dict],
+        batch_size: int = 100,
+        workers: int = 4,
+        missing_only: bool = False,
+    ) -> int:
+        """Embed entries and store their vectors. Returns count embedded.
+
+        By default all vectors are rebuilt from scratch; with missing_only,
+        existing vectors are kept and only entries without one are embedded.
+        Batches are embedded concurrently on `workers` threads; each batch
+        is appended with a single write, in input order.
+        """
+        if missing_only:
+            m = self._sidecar_matrix()
+            if m is not None:
+                entries = [e for e in entries if e["id"] not in m.rows]
+            else:
+                existing = self._vectors()
+                entries = [e for e in entries if not existing.get(e["id"])]
+        else:
+            self._save_vectors({})  # Clear
+            self._drop_ivf()
+        batches = [
+            [{"id": e["id"], "text": e["text"]} for e in entries[i:i + batch_size]]
+            for i in range(0, len(entries), batch_size)
+        ]
         total = 0
-        for i in range(0, len(entries), batch_size):
-            batch = [{"id": e["id"], "text": e["text"]} for e in entries[i:i + batch_size]]
-            total += self.embed_batch(batch)
+        if batches:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+                for pairs in pool.map(self._embed_items, batches):
+                    self._append_vectors(pairs)
+                    total += len(pairs)
+        m = self._matrix()
+        if m is not None:
+            self._save_matrix_file(self._mat_cache[0], m)
         return total
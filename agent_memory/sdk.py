@@ -13,16 +13,18 @@ Usage:
     md = mem.export(fmt="md")  # or "json"
 """
 
+import heapq
+import io
 import json
-import math
 import os
-import re
-import uuid
-from datetime import datetime, timezone
-from math import exp
+import time
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Set, TextIO, Tuple
 
+from ._files import DELETED, TAG_PATCH, copy_entry, count_plain_lines, dumps_line, find_record, iter_lines, loads, needs_compaction, new_entries, new_entry, patch_tags, replay, stat_key, tail_entries, utc_now, write_export
+from ._index import KeywordIndex, drop_index_file, load_index, tokenize
 from .embeddings import VectorStore
 
 
@@ -30,6 +32,15 @@ STORE_DIR = ".agent-memory"
 MEMORIES_FILE = "memories.jsonl"
 CONFIG_FILE = "config.json"
 
+# Byte patterns that only appear in a delete or tag patch record (or in a
+# string equal to the key, which just disables the fast path)
+_RECORD_MARKERS = (json.dumps(DELETED).encode(), json.dumps(TAG_PATCH).encode())
+
+# Inside batch(), buffered records are written once this many pile up, or
+# once the oldest has waited this long
+_BATCH_FLUSH_RECORDS = 64
+_BATCH_FLUSH_SECONDS = 0.5
+
 DEFAULT_CONFIG = {
     "store_path": STORE_DIR,
     "default_export_format": "md",
@@ -45,13 +56,35 @@ class Memory:
         path: Root directory containing (or to contain) .agent-memory/.
               Defaults to current working directory.
         config: Optional config overrides (merged with defaults).
+        clock: Returns the current aware datetime, used for new entry
+               timestamps and time decay. Defaults to UTC now.
     """
 
-    def __init__(self, path: Optional[str] = None, config: Optional[dict] = None):
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        config: Optional[dict] = None,
+        clock: Optional[Callable[[], datetime]] = None,
+    ):
         self._root = Path(path or os.getcwd())
         self._config = {**DEFAULT_CONFIG, **(config or {})}
+        self._clock = clock or utc_now
         self._store_dir: Optional[Path] = None
         self._vector_store: Optional[VectorStore] = None
+        # ((mtime_ns, size) of memories.jsonl, parsed entries)
+        self._entries_cache: Optional[Tuple[Tuple[int, int], list]] = None
+        # Records (entries, deletes, tag patches) in the file the cache was read from
+        self._records = 0
+        # Same key, keyword index over those entries
+        self._kw_index: Optional[Tuple[Tuple[int, int], KeywordIndex]] = None
+        # Same key, id -> first entry with that id
+        self._by_id: Optional[Tuple[Tuple[int, int], Dict[str, dict]]] = None
+        # Append handle to memories.jsonl, kept open across writes
+        self._writer: Optional[BinaryIO] = None
+        # Encoded records not yet written, and when the first was queued
+        self._pending: List[bytes] = []
+        self._pending_since = 0.0
+        self._batching = 0
 
     @property
     def store(self) -> Path:
@@ -93,22 +126,161 @@ class Memory:
                 f"Memory store not found at {self.store}. Call .init() first."
             )
 
+    def _cached_entries(self) -> Optional[list]:
+        """Return the cached entry list if memories.jsonl is unchanged on disk."""
+        self._flush()
+        if self._entries_cache is None:
+            return None
+        if stat_key(self._memories_path) != self._entries_cache[0]:
+            self._entries_cache = None
+            return None
+        return self._entries_cache[1]
+
     def _load_all(self) -> list:
+        """Load all entries, re-parsing only if the file changed since last load.
+
+        Returns a new list, but the entry dicts are shared with the cache:
+        internal use only, public methods hand out copy_entry() copies.
+        """
         self._ensure_store()
+        cached = self._cached_entries()
+        if cached is not None:
+            return list(cached)
         p = self._memories_path
-        if not p.exists():
+        # Stat before reading so a concurrent write can only cause a re-parse
+        key = stat_key(p)
+        if key is None:
             return []
-        entries = []
-        for line in p.read_text().splitlines():
-            line = line.strip()
-            if line:
-                entries.append(json.loads(line))
-        return entries
+        entries, self._records = replay(loads(line) for line in iter_lines(p))
+        self._entries_cache = (key, entries)
+        return list(entries)
 
     def _save_all(self, entries: list):
-        with open(self._memories_path, "w") as f:
+        self._flush()
+        drop_index_file(self._memories_path)
+        with open(self._memories_path, "wb") as f:
             for e in entries:
-                f.write(json.dumps(e, ensure_ascii=False) + "\n")
+                f.write(dumps_line(e))
+        self._entries_cache = (stat_key(self._memories_path), list(entries))
+        self._records = len(entries)
+        self._by_id = None
+
+    def _append_record(self, record: dict) -> Optional[list]:
+        """Append one record to memories.jsonl.
+
+        Returns the cached entry list if it was current, for the caller to
+        update in place to match the record; None otherwise. A current
+        keyword index and id map are carried over too, so the caller must
+        update or drop them.
+
+        Inside batch() the record may only be queued; it is written before
+        this instance next reads the file, and when the batch ends.
+        """
+        return self._append_records([record])
+
+    def _append_records(self, records: List[dict]) -> Optional[list]:
+        """Append several records in one write; see _append_record()."""
+        if self._pending:
+            # Checked against the file when the queue is flushed
+            cached = self._entries_cache[1] if self._entries_cache is not None else None
+        else:
+            cached = self._cached_entries()
+            self._pending_since = time.monotonic()
+        self._pending.extend(map(dumps_line, records))
+        if cached is not None:
+            self._records += len(records)
+        if (
+            not self._batching
+            or len(self._pending) >= _BATCH_FLUSH_RECORDS
+            or time.monotonic() - self._pending_since >= _BATCH_FLUSH_SECONDS
+        ):
+            self._flush()
+        return cached
+
+    def _flush(self):
+        """Write queued records and move caches that matched the file onto its new key."""
+        if not self._pending:
+            return
+        p = self._memories_path
+        try:
+            st = os.stat(p)
+        except FileNotFoundError:
+            st = None
+        w = self._writer
+        if w is not None and (st is None or not os.path.samestat(st, os.fstat(w.fileno()))):
+            w.close()  # The file was replaced or removed under us
+            w = self._writer = None
+        if w is None:
+            w = self._writer = open(p, "ab")
+        w.write(b"".join(self._pending))
+        w.flush()
+        self._pending.clear()
+
+        old_key = (st.st_mtime_ns, st.st_size) if st is not None else None
+        st = os.fstat(w.fileno())
+        key = (st.st_mtime_ns, st.st_size)
+        if self._entries_cache is not None and self._entries_cache[0] == old_key:
+            self._entries_cache = (key, self._entries_cache[1])
+        else:
+            self._entries_cache = None
+        if self._kw_index is not None and self._kw_index[0] == old_key:
+            self._kw_index = (key, self._kw_index[1])
+        else:
+            self._kw_index = None
+        if self._by_id is not None and self._by_id[0] == old_key:
+            self._by_id = (key, self._by_id[1])
+        else:
+            self._by_id = None
+
+    @contextmanager
+    def batch(self) -> Iterator["Memory"]:
+        """Buffer writes to memories.jsonl for bulk ingestion.
+
+        Inside the block, records are written in chunks instead of one write
+        per add/tag/delete. This instance always sees its own writes; other
+        processes and Memory objects see them once a chunk is flushed or
+        the block exits.
+        """
+        self._batching += 1
+        try:
+            yield self
+        finally:
+            self._batching -= 1
+            if not self._batching:
+                self._flush()
+
+    def close(self):
+        """Write any queued records and close the append handle."""
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _maybe_compact(self):
+        """Compact once dead records outnumber live entries."""
+        cached = self._cached_entries()
+        if cached is None:
+            if needs_compaction(self._memories_path):
+                self.compact()
+        elif self._records > 2 * len(cached):
+            self._save_all(cached)
+
+    def compact(self) -> int:
+        """Rewrite memories.jsonl without deleted or superseded records.
+
+        Returns the number of records dropped.
+        """
+        entries = self._load_all()
+        dropped = self._records - len(entries)
+        if dropped:
+            self._save_all(entries)
+        return dropped
 
     def add(
         self,
@@ -119,32 +291,86 @@ class Memory:
     ) -> dict:
         """Add a memory. Returns the created entry."""
         self._ensure_store()
-        importance = max(1, min(5, int(importance)))
-        entry = {
-            "id": uuid.uuid4().hex[:12],
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "text": text,
-            "tags": tags or [],
-            "metadata": metadata or {},
-            "importance": importance,
-        }
-        with open(self._memories_path, "a") as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        entry = new_entry(text, tags, metadata, importance, self._clock().isoformat())
+        self._cache_added([entry], self._append_record(entry))
         # Auto-embed if configured
         if self.vectors.enabled:
             self.vectors.embed_and_store(entry["id"], text)
-        return entry
+        return copy_entry(entry)
+
+    def add_many(self, items: list, batch_size: int = 100) -> list:
+        """Add several memories with a single write. Returns the created entries.
+
+        items: texts, or dicts with "text" and optional "tags", "metadata"
+        and "importance" keys (same meaning as add()'s arguments). All
+        entries share one timestamp. If embeddings are configured, they are
+        requested batch_size texts per API call.
+        """
+        self._ensure_store()
+        entries = new_entries(items, self._clock().isoformat())
+        if not entries:
+            return []
+        self._cache_added(entries, self._append_records(entries))
+        if self.vectors.enabled:
+            for i in range(0, len(entries), batch_size):
+                self.vectors.embed_batch(entries[i:i + batch_size])
+        return [copy_entry(e) for e in entries]
+
+    def _cache_added(self, entries: List[dict], cached: Optional[list]):
+        """Bring a current cache, index and id map up to date with new entries."""
+        if cached is None:
+            return
+        cached.extend(entries)
+        if self._kw_index is not None:
+            index = self._kw_index[1]
+            for e in entries:
+                index.add(e)
+        if self._by_id is not None:
+            by_id = self._by_id[1]
+            for e in entries:
+                by_id.setdefault(e["id"], e)
 
     def list(self, limit: int = 20) -> list:
         """List recent memories (most recent last)."""
-        return self._load_all()[-limit:]
+        self._ensure_store()
+        if limit > 0 and self._cached_entries() is None:
+            # Cold cache: parse only the end of the file
+            tail = tail_entries(self._memories_path, limit)
+            if tail is not None:
+                return tail
+        return [copy_entry(e) for e in self._load_all()[-limit:]]
 
     def get(self, memory_id: str) -> Optional[dict]:
         """Get a single memory by ID."""
-        for e in self._load_all():
-            if e["id"] == memory_id:
-                return e
-        return None
+        self._ensure_store()
+        known, entry = self._lookup_cold(memory_id)
+        if known:
+            return entry  # Parsed just now, not shared with a cache
+        entry = self._id_map().get(memory_id)
+        return copy_entry(entry) if entry is not None else None
+
+    def _lookup_cold(self, memory_id: str) -> Tuple[bool, Optional[dict]]:
+        """On a cold cache, look one id up in place instead of parsing the file.
+
+        Returns find_record()'s (known, entry); (False, None) if the cache
+        is warm and a dict lookup is cheaper.
+        """
+        if self._cached_entries() is not None:
+            return False, None
+        return find_record(self._memories_path, memory_id)
+
+    def _id_map(self) -> Dict[str, dict]:
+        """id -> entry over all entries, rebuilt only when the file changes."""
+        entries = self._load_all()
+        cache = self._entries_cache
+        if self._by_id is None or cache is None or self._by_id[0] != cache[0]:
+            by_id: Dict[str, dict] = {}
+            for e in entries:
+                by_id.setdefault(e["id"], e)
+            if cache is None:
+                return by_id
+            self._by_id = (cache[0], by_id)
+        return self._by_id[1]
 
     def search(
         self,
@@ -168,107 +394,139 @@ class Memory:
         if mode is None:
             mode = "vector" if self.vectors.enabled else "keyword"
 
-        entries = self._load_all()
+        vector_only = mode == "vector" and self.vectors.enabled
+        index = None
+        docs = None
         if tag:
-            entries = [e for e in entries if tag in e.get("tags", [])]
+            # Filter through the tag index so untagged entries are never scored
+            index = self._keyword_index()
+            docs = set(index.docs_with_tag(tag))
+            entries = [index.entries[i] for i in index.docs_with_tag(tag)]
+        else:
+            # Vector search alone doesn't need (or build) the index
+            if not vector_only:
+                index = self._keyword_index()
+            # The index keeps holes for deleted docs, so take the live list
+            entries = self._cached_entries()
+            if entries is None:
+                self._load_all()
+                entries = self._cached_entries() or []
         if not entries:
             return []
 
-        if mode == "vector" and self.vectors.enabled:
-            return self.vectors.search(query, entries, limit)
+        if vector_only:
+            results = self.vectors.search(query, entries, limit)
         elif mode == "hybrid" and self.vectors.enabled:
-            return self._hybrid_search(query, entries, limit)
+            results = self._hybrid_search(query, entries, limit, index, docs)
         else:
-            return self._keyword_search(query, entries, limit)
+            results = self._keyword_search(query, entries, limit, index, docs)
+        return [copy_entry(e) for e in results]
 
-    def _keyword_search(self, query: str, entries: list, limit: int) -> list:
-        """TF-IDF keyword search with time-decay and importance scoring."""
+    def _keyword_index(self) -> KeywordIndex:
+        """Keyword index over all entries, rebuilt only when the file changes."""
+        entries = self._load_all()
+        cache = self._entries_cache
+        if cache is None:
+            return KeywordIndex(entries)
+        if self._kw_index is None or self._kw_index[0] != cache[0]:
+            self._kw_index = (cache[0], load_index(self._memories_path, entries, cache[0]))
+        return self._kw_index[1]
+
+    def _keyword_search(
+        self,
+        query: str,
+        entries: list,
+        limit: int,
+        index: Optional[KeywordIndex] = None,
+        docs: Optional[Set[int]] = None,
+        return_scores: bool = False,
+    ):
+        """TF-IDF keyword search with time-decay and importance scoring.
+
+        index: prebuilt index containing entries; built on the fly if omitted.
+        docs: positions of entries within index, if they are a subset of it.
+        return_scores: return {entry id: score} for every match instead of
+        the top `limit` entries.
+        """
         decay_lambda = self._config.get("time_decay_lambda", 0.01)
         query_tokens = set(self._tokenize(query))
         if not query_tokens:
-            return entries[-limit:]
-
-        now = datetime.now(timezone.utc)
-        docs = []
-        for e in entries:
-            tokens = self._tokenize(e["text"] + " " + " ".join(e.get("tags", [])))
-            docs.append(tokens)
-        N = len(docs)
-        df: dict = {}
-        for tokens in docs:
-            for t in set(tokens):
-                df[t] = df.get(t, 0) + 1
-
-        scored = []
-        for i, tokens in enumerate(docs):
-            tf: dict = {}
-            for t in tokens:
-                tf[t] = tf.get(t, 0) + 1
-            tfidf_score = sum(
-                tf[qt] * math.log((N + 1) / (df[qt] + 0.5))
-                for qt in query_tokens
-                if qt in tf and qt in df
-            )
-            if tfidf_score > 0:
-                ts = entries[i].get("timestamp", "")
-                try:
-                    entry_time = datetime.fromisoformat(ts)
-                    days_old = (now - entry_time).total_seconds() / 86400.0
-                except (ValueError, TypeError):
-                    days_old = 0.0
-                time_factor = exp(-decay_lambda * days_old) if decay_lambda > 0 else 1.0
-                importance = entries[i].get("importance", 3)
-                importance_factor = importance / 3.0
-                final_score = tfidf_score * time_factor * importance_factor
-                scored.append((final_score, entries[i]))
-        scored.sort(key=lambda x: -x[0])
-        return [e for _, e in scored[:limit]]
-
-    def _hybrid_search(self, query: str, entries: list, limit: int) -> list:
+            return {} if return_scores else entries[-limit:]
+        if index is None:
+            index = KeywordIndex(entries)
+            docs = None
+        entries = index.entries
+
+        now = self._clock().timestamp()
+        if return_scores:
+            scored = index.ranked_scores(query_tokens, decay_lambda, now, docs)
+            return {entries[i]["id"]: score for score, i in scored}
+        return [entries[i] for i in index.top_docs(query_tokens, decay_lambda, now, limit, docs)]
+
+    def _hybrid_search(
+        self,
+        query: str,
+        entries: list,
+        limit: int,
+        index: Optional[KeywordIndex] = None,
+        docs: Optional[Set[int]] = None,
+    ) -> list:
         """Combine keyword and vector scores (0.4 keyword + 0.6 vector)."""
-        from .embeddings import cosine_similarity, get_embeddings
+        from .embeddings import embed_query
 
-        # Keyword scores (normalized)
-        keyword_results = self._keyword_search(query, entries, len(entries))
-        keyword_scores = {}
-        if keyword_results:
-            max_score = 1.0  # We don't have raw scores here, use rank
-            for rank, e in enumerate(keyword_results):
-                keyword_scores[e["id"]] = 1.0 - (rank / len(keyword_results))
+        # Keyword scores; normalized to the best match when combined below
+        keyword_scores = self._keyword_search(query, entries, limit, index, docs, return_scores=True)
+        max_score = max(keyword_scores.values()) if keyword_scores else 1.0
 
         # Vector scores
         vector_scores = {}
-        query_vec_result = get_embeddings([query], self._config)
-        if query_vec_result:
-            from .embeddings import VectorStore
-            vs = VectorStore(self.store, self._config)
-            vectors = vs._load_vectors()
-            for e in entries:
-                vec = vectors.get(e["id"])
-                if vec:
-                    vector_scores[e["id"]] = cosine_similarity(query_vec_result[0], vec)
+        query_vec = embed_query(query, self._config)
+        if query_vec is not None:
+            for sim, e in self.vectors._score_entries(query_vec, entries):
+                vector_scores[e["id"]] = sim
 
-        # Combine
+        # Combine, keeping only entries that can make the cut
         combined = []
         for e in entries:
-            ks = keyword_scores.get(e["id"], 0.0)
-            vs_score = vector_scores.get(e["id"], 0.0)
-            combined.append((0.4 * ks + 0.6 * vs_score, e))
-        combined.sort(key=lambda x: -x[0])
-        return [e for score, e in combined[:limit] if score > 0]
-
-    def rebuild_vectors(self, batch_size: int = 100) -> int:
-        """Rebuild all vector embeddings from scratch. Returns count embedded."""
+            mid = e["id"]
+            ks = keyword_scores.get(mid, 0.0) / max_score
+            score = 0.4 * ks + 0.6 * vector_scores.get(mid, 0.0)
+            if score > 0:
+                combined.append((score, e))
+        top = heapq.nlargest(limit, combined, key=lambda x: x[0])
+        return [e for _, e in top]
+
+    def rebuild_vectors(self, batch_size: int = 100, missing_only: bool = False) -> int:
+        """Rebuild vector embeddings. Returns count embedded.
+
+        Rebuilds all from scratch, or with missing_only keeps existing vectors
+        and embeds only memories without one.
+        """
         entries = self._load_all()
-        return self.vectors.rebuild(entries, batch_size)
+        return self.vectors.rebuild(entries, batch_size, missing_only=missing_only)
+
+    def build_ivf(self, nlist: Optional[int] = None) -> int:
+        """Cluster stored vectors so vector search scans only nearby ones.
+
+        Returns the number of lists (0 without numpy or vectors).
+        """
+        return self.vectors.build_ivf(nlist)
 
     def delete(self, memory_id: str) -> bool:
         """Delete a memory by ID. Returns True if found."""
-        entries = self._load_all()
-        new = [e for e in entries if e["id"] != memory_id]
-        if len(new) == len(entries):
+        self._ensure_store()
+        known, entry = self._lookup_cold(memory_id)
+        if not (entry is not None if known else memory_id in self._id_map()):
             return False
-        self._save_all(new)
+        # Append a tombstone instead of rewriting the file
+        cached = self._append_record({"id": memory_id, DELETED: True})
+        if cached is not None:
+            cached[:] = [e for e in cached if e["id"] != memory_id]
+            if self._kw_index is not None:
+                self._kw_index[1].remove(memory_id)
+            if self._by_id is not None:
+                self._by_id[1].pop(memory_id, None)
+        self._maybe_compact()
         # Clean up vector
         if self.vectors.enabled:
             self.vectors.delete(memory_id)
@@ -281,45 +539,54 @@ class Memory:
         remove: Optional[list] = None,
     ) -> Optional[dict]:
         """Add/remove tags. Returns updated entry or None if not found."""
-        entries = self._load_all()
-        found = None
-        for e in entries:
-            if e["id"] == memory_id:
-                tags = set(e.get("tags", []))
-                if add:
-                    tags.update(add)
-                if remove:
-                    tags -= set(remove)
-                e["tags"] = sorted(tags)
-                found = e
-                break
+        self._ensure_store()
+        known, found = self._lookup_cold(memory_id)
+        if not known:
+            found = self._id_map().get(memory_id)
         if not found:
             return None
-        self._save_all(entries)
-        return found
+        patch = {"add": list(add or []), "remove": list(remove or [])}
+        cached = self._append_record({"id": memory_id, TAG_PATCH: patch})
+        found["tags"] = patch_tags(found.get("tags", []), add, remove)
+        if cached is not None:
+            index = self._kw_index[1] if self._kw_index is not None else None
+            doc = index.first_doc(memory_id) if index is not None else None
+            if doc is not None and index.entries[doc] is found:
+                index.retag(doc, found["tags"])
+            else:
+                self._kw_index = None
+        self._maybe_compact()
+        return copy_entry(found)
 
     def export(self, fmt: Optional[str] = None) -> str:
         """Export memories as markdown or JSON string."""
+        buf = io.StringIO()
+        self.stream_export(buf, fmt)
+        return buf.getvalue()
+
+    def stream_export(self, file: TextIO, fmt: Optional[str] = None):
+        """Write the export() output to a text file object piece by piece."""
         if fmt is None:
             fmt = self._config.get("default_export_format", "md")
-        entries = self._load_all()
-        if fmt == "json":
-            return json.dumps(entries, indent=2, ensure_ascii=False)
-        # Markdown
-        lines = ["# Agent Memory Export", ""]
-        for e in entries:
-            ts = e.get("timestamp", "")[:19].replace("T", " ")
-            tags = ", ".join(e.get("tags", []))
-            lines.append(f"## {e['id']} ({ts})")
-            if tags:
-                lines.append(f"**Tags:** {tags}")
-            lines.append("")
-            lines.append(e["text"])
-            lines.append("")
-        return "\n".join(lines)
+        write_export(self._load_all(), fmt, file.write)
+
+    def export_to_file(self, path, fmt: Optional[str] = None) -> Path:
+        """Write the export() output to a UTF-8 file at path. Returns the path."""
+        path = Path(path)
+        with open(path, "w", encoding="utf-8") as f:
+            self.stream_export(f, fmt)
+        return path
 
     def count(self) -> int:
         """Return total number of memories."""
+        self._ensure_store()
+        cached = self._cached_entries()
+        if cached is not None:
+            return len(cached)
+        # Without deletes or tag patches in the log, every line is one entry
+        n = count_plain_lines(self._memories_path, _RECORD_MARKERS)
+        if n is not None:
+            return n
         return len(self._load_all())
 
     def clear(self) -> int:
@@ -331,7 +598,7 @@ class Memory:
 
     @staticmethod
     def _tokenize(text: str) -> list:
-        return re.findall(r"\w+", text.lower())
+        return tokenize(text)
 
     def __repr__(self) -> str:
         return f"Memory(path={self._root!r}, store={self.store!r})"
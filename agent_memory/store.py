@@ -1,18 +1,24 @@
 """Core storage and search logic."""
+import io
 import json
-import math
 import os
-import re
-import uuid
-from datetime import datetime, timezone
-from math import exp
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, TextIO, Tuple
 
+from ._files import DELETED, TAG_PATCH, copy_entry, dumps_line, find_record, iter_lines, loads, new_entries, new_entry, patch_tags, replay, stat_key, tail_entries, utc_now, write_export
+from ._index import drop_index_file, load_index, tokenize
 from .config import STORE_DIR, CONFIG_FILE, load_config, create_default_config
 
 MEMORIES_FILE = "memories.jsonl"
 
+# memories.jsonl -> ((mtime_ns, size), live entries, record count)
+_LOG_CACHE: Dict[Path, Tuple[Tuple[int, int], List[dict], int]] = {}
+# Current aware datetime for new timestamps and time decay; swappable in tests
+_clock = utc_now
+
+# (cwd, store_path) -> store directory found by _root(). Only hits are cached.
+_ROOT_CACHE: Dict[Tuple[Path, str], Path] = {}
+
 
 def _root() -> Path:
     """Resolve store directory from config or walk up to find .agent-memory/."""
@@ -22,18 +28,25 @@ def _root() -> Path:
     sp = Path(store_path)
     if sp.is_absolute():
         return sp
+    cwd = Path.cwd()
+    cached = _ROOT_CACHE.get((cwd, store_path))
+    if cached is not None and cached.is_dir():
+        return cached
     # Walk up to find existing store
-    p = Path.cwd()
+    p = cwd
     while p != p.parent:
         if (p / store_path).is_dir():
+            _ROOT_CACHE[(cwd, store_path)] = p / store_path
             return p / store_path
         p = p.parent
-    return Path.cwd() / store_path
+    return cwd / store_path
 
 
 def init_store() -> Path:
     d = Path.cwd() / STORE_DIR
     d.mkdir(exist_ok=True)
+    # The new store may be closer to some cwd than a cached one
+    _ROOT_CACHE.clear()
     cfg = d / CONFIG_FILE
     if not cfg.exists():
         create_default_config(d)
@@ -48,40 +61,94 @@ def add_memory(text: str, tags=None, metadata=None, importance: int = 3) -> dict
     d = _root()
     if not d.is_dir():
         raise FileNotFoundError("Not initialized. Run `agent-memory init` first.")
-    importance = max(1, min(5, int(importance)))
-    entry = {
-        "id": uuid.uuid4().hex[:12],
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "text": text,
-        "tags": tags or [],
-        "metadata": metadata or {},
-        "importance": importance,
-    }
-    with open(d / MEMORIES_FILE, "a") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    entry = new_entry(text, tags, metadata, importance, _clock().isoformat())
+    with open(d / MEMORIES_FILE, "ab") as f:
+        f.write(dumps_line(entry))
     print(f"Added memory {entry['id']}")
     return entry
 
 
-def _load_all() -> List[dict]:
+def add_memories(items: list) -> List[dict]:
+    """Add several memories with one write.
+
+    items: texts, or dicts with "text" and optional "tags", "metadata" and
+    "importance". All entries share one timestamp.
+    """
     d = _root()
-    p = d / MEMORIES_FILE
-    if not p.exists():
-        return []
-    entries = []
-    for line in p.read_text().splitlines():
-        line = line.strip()
-        if line:
-            entries.append(json.loads(line))
+    if not d.is_dir():
+        raise FileNotFoundError("Not initialized. Run `agent-memory init` first.")
+    entries = new_entries(items, _clock().isoformat())
+    with open(d / MEMORIES_FILE, "ab") as f:
+        f.write(b"".join(map(dumps_line, entries)))
+    print(f"Added {len(entries)} memories")
     return entries
 
 
+def _load_log() -> Tuple[List[dict], int]:
+    """(live entries, number of records in memories.jsonl).
+
+    Re-parses only if the file changed since the last call for this store.
+    Returns a new list, but the entry dicts are shared with the cache.
+    """
+    p = _root() / MEMORIES_FILE
+    # Stat before reading so a concurrent write can only cause a re-parse
+    key = stat_key(p)
+    if key is None:
+        return [], 0
+    cached = _LOG_CACHE.get(p)
+    if cached is None or cached[0] != key:
+        entries, records = replay(loads(line) for line in iter_lines(p))
+        cached = _LOG_CACHE[p] = (key, entries, records)
+    return list(cached[1]), cached[2]
+
+
+def _load_all() -> List[dict]:
+    return _load_log()[0]
+
+
+def _is_cached(p: Path) -> bool:
+    cached = _LOG_CACHE.get(p)
+    return cached is not None and cached[0] == stat_key(p)
+
+
+def _rewrite(p: Path, live: List[dict]):
+    drop_index_file(p)
+    with open(p, "wb") as f:
+        for e in live:
+            f.write(dumps_line(e))
+
+
+def _append_record(record: dict, live: List[dict], records: int):
+    """Append a delete/tag record, compacting once dead records outnumber live ones."""
+    p = _root() / MEMORIES_FILE
+    if records + 1 > 2 * len(live):
+        _rewrite(p, live)
+        return
+    with open(p, "ab") as f:
+        f.write(dumps_line(record))
+
+
+def _append_unparsed(record: dict, p: Path):
+    """_append_record() for when the log hasn't been parsed.
+
+    Without parsed counts this never compacts: counting records would read
+    the whole file on every delete or tag. `agent-memory compact` (or a
+    Memory delete or tag) does it instead.
+    """
+    with open(p, "ab") as f:
+        f.write(dumps_line(record))
+
+
 def list_memories(n: int = 20) -> List[dict]:
-    return _load_all()[-n:]
+    if n > 0:
+        tail = tail_entries(_root() / MEMORIES_FILE, n)
+        if tail is not None:
+            return tail
+    return [copy_entry(e) for e in _load_all()[-n:]]
 
 
 def _tokenize(text: str) -> List[str]:
-    return re.findall(r"\w+", text.lower())
+    return tokenize(text)
 
 
 def search_memories(query: str, limit: Optional[int] = None) -> List[dict]:
@@ -94,116 +161,84 @@ def search_memories(query: str, limit: Optional[int] = None) -> List[dict]:
     if limit is None:
         limit = config.get("max_results", 10)
     decay_lambda = config.get("time_decay_lambda", 0.01)
+    p = _root() / MEMORIES_FILE
+    key = stat_key(p)  # before reading, like Memory's entry cache
     entries = _load_all()
     if not entries:
         return []
     query_tokens = set(_tokenize(query))
     if not query_tokens:
-        return entries[-limit:]
-
-    now = datetime.now(timezone.utc)
-
-    # Build document frequency
-    docs = []
-    for e in entries:
-        tokens = _tokenize(e["text"] + " " + " ".join(e.get("tags", [])))
-        docs.append(tokens)
-    N = len(docs)
-    df = {}
-    for tokens in docs:
-        for t in set(tokens):
-            df[t] = df.get(t, 0) + 1
-
-    # Score each doc
-    scored = []
-    for i, tokens in enumerate(docs):
-        tf = {}
-        for t in tokens:
-            tf[t] = tf.get(t, 0) + 1
-        tfidf_score = 0.0
-        for qt in query_tokens:
-            if qt in tf and qt in df:
-                tfidf_score += tf[qt] * math.log((N + 1) / (df[qt] + 0.5))
-        if tfidf_score > 0:
-            # Time decay
-            ts = entries[i].get("timestamp", "")
-            try:
-                entry_time = datetime.fromisoformat(ts)
-                days_old = (now - entry_time).total_seconds() / 86400.0
-            except (ValueError, TypeError):
-                days_old = 0.0
-            time_factor = exp(-decay_lambda * days_old) if decay_lambda > 0 else 1.0
-
-            # Importance
-            importance = entries[i].get("importance", 3)
-            importance_factor = importance / 3.0
-
-            final_score = tfidf_score * time_factor * importance_factor
-            scored.append((final_score, entries[i]))
-    scored.sort(key=lambda x: -x[0])
-    return [e for _, e in scored[:limit]]
+        return [copy_entry(e) for e in entries[-limit:]]
+
+    now = _clock().timestamp()
+    index = load_index(p, entries, key)
+    top = index.top_docs(query_tokens, decay_lambda, now, limit)
+    # Copies: the dicts are shared with the process-wide load cache
+    return [copy_entry(index.entries[i]) for i in top]
 
 
 def delete_memory(memory_id: str) -> bool:
     """Delete a memory by ID. Returns True if found and deleted."""
-    d = _root()
-    entries = _load_all()
-    new_entries = [e for e in entries if e["id"] != memory_id]
-    if len(new_entries) == len(entries):
+    p = _root() / MEMORIES_FILE
+    if not _is_cached(p):
+        # Look the id up in place instead of parsing the whole file
+        known, entry = find_record(p, memory_id)
+        if known:
+            if entry is None:
+                return False
+            _append_unparsed({"id": memory_id, DELETED: True}, p)
+            return True
+    entries, records = _load_log()
+    live = [e for e in entries if e["id"] != memory_id]
+    if len(live) == len(entries):
         return False
-    with open(d / MEMORIES_FILE, "w") as f:
-        for e in new_entries:
-            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+    _append_record({"id": memory_id, DELETED: True}, live, records)
     return True
 
 
 def tag_memory(memory_id: str, add_tags: List[str] = None, remove_tags: List[str] = None) -> Optional[dict]:
     """Add or remove tags from a memory. Returns updated entry or None if not found."""
-    d = _root()
-    entries = _load_all()
+    patch = {"add": list(add_tags or []), "remove": list(remove_tags or [])}
+    p = _root() / MEMORIES_FILE
+    if not _is_cached(p):
+        known, entry = find_record(p, memory_id)
+        if known:
+            if entry is None:
+                return None
+            entry["tags"] = patch_tags(entry.get("tags", []), add_tags, remove_tags)
+            _append_unparsed({"id": memory_id, TAG_PATCH: patch}, p)
+            return entry
+    entries, records = _load_log()
     found = None
-    for e in entries:
+    for i, e in enumerate(entries):
         if e["id"] == memory_id:
-            tags = set(e.get("tags", []))
-            if add_tags:
-                tags.update(add_tags)
-            if remove_tags:
-                tags -= set(remove_tags)
-            e["tags"] = sorted(tags)
-            found = e
+            # Copy: the dicts are shared with the load cache
+            found = entries[i] = {**e, "tags": patch_tags(e.get("tags", []), add_tags, remove_tags)}
             break
     if not found:
         return None
-    with open(d / MEMORIES_FILE, "w") as f:
-        for e in entries:
-            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+    _append_record({"id": memory_id, TAG_PATCH: patch}, entries, records)
     return found
 
 
 def export_memories(fmt: Optional[str] = None) -> str:
     """Export memories. fmt defaults to config default_export_format."""
+    buf = io.StringIO()
+    stream_export_memories(fmt, buf)
+    return buf.getvalue()
+
+
+def stream_export_memories(fmt: Optional[str], out: TextIO):
+    """Write the export_memories() output to out without building it first."""
     if fmt is None:
         config = load_config()
         fmt = config.get("default_export_format", "md")
-    if fmt == "json":
-        return export_json()
-    return export_markdown()
+    write_export(_load_all(), fmt, out.write)
 
 
 def export_markdown() -> str:
-    entries = _load_all()
-    lines = ["# Agent Memory Export", ""]
-    for e in entries:
-        ts = e.get("timestamp", "")[:19].replace("T", " ")
-        tags = ", ".join(e.get("tags", []))
-        lines.append(f"## {e['id']} ({ts})")
-        if tags:
-            lines.append(f"**Tags:** {tags}")
-        lines.append("")
-        lines.append(e["text"])
-        lines.append("")
-    return "\n".join(lines)
+    return export_memories("md")
 
 
 def export_json() -> str:
-    return json.dumps(_load_all(), indent=2, ensure_ascii=False)
+    return export_memories("json")
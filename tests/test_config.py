@@ -1,16 +1,19 @@
 """Tests for configuration file support."""
+import io
 import json
 import os
 import tempfile
 import unittest
+from contextlib import redirect_stdout
 from pathlib import Path
+from unittest import mock
 
 # Ensure we can import the package
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from agent_memory.config import load_config, save_config, create_default_config, DEFAULT_CONFIG
-from agent_memory import store
+from agent_memory import cli, store
 
 
 class TestConfig(unittest.TestCase):
@@ -108,6 +111,90 @@ class TestConfig(unittest.TestCase):
         parsed = json.loads(output)
         self.assertIsInstance(parsed, list)
 
+    def test_config_cache_tracks_file(self):
+        """load_config notices a config created or edited after a cached load."""
+        self.assertEqual(load_config()["max_results"], 10)
+        d = Path(self.tmpdir) / ".agent-memory"
+        d.mkdir()
+        save_config({"max_results": 3}, target_dir=d)
+        config = load_config()
+        self.assertEqual(config["max_results"], 3)
+        config["max_results"] = 99  # callers get their own copy
+        (d / "config.json").write_text(json.dumps({"max_results": 7}))
+        self.assertEqual(load_config()["max_results"], 7)
+
+    def test_store_cache_tracks_writes(self):
+        """Cached store reads pick up adds, tag edits and deletes."""
+        store.init_store()
+        e = store.add_memory("cached entry")
+        self.assertEqual([x["id"] for x in store.list_memories()], [e["id"]])
+        store.tag_memory(e["id"], add_tags=["t"])
+        self.assertEqual(store.search_memories("cached")[0]["tags"], ["t"])
+        store.add_memory("second entry")
+        self.assertEqual(len(store._load_all()), 2)
+        store.delete_memory(e["id"])
+        self.assertEqual([x["text"] for x in store._load_all()], ["second entry"])
+
+    def test_add_memories_single_write(self):
+        """add_memories appends every entry and they read back in order."""
+        store.init_store()
+        added = store.add_memories(["one", {"text": "two", "tags": ["t"]}])
+        self.assertEqual([e["id"] for e in store.list_memories()], [e["id"] for e in added])
+        self.assertEqual(store.search_memories("two")[0]["tags"], ["t"])
+
+    def test_cold_delete_skips_record_count(self):
+        """A delete on an unparsed store appends without re-reading the file."""
+        store.init_store()
+        entries = store.add_memories(["one", "two", "three"])
+        store._LOG_CACHE.clear()
+        with mock.patch("agent_memory._files.count_records", side_effect=AssertionError):
+            for e in entries:
+                self.assertTrue(store.delete_memory(e["id"]))
+        self.assertEqual(store.list_memories(), [])
+
+    def test_returned_entries_are_copies(self):
+        """Editing a returned entry doesn't leak into the shared store cache."""
+        store.init_store()
+        store.add_memory("hello world", tags=["t"])
+        store.search_memories("hello")[0]["text"] = "MUT"
+        store.list_memories()[0]["tags"].append("x")
+        store.search_memories("")[0]["text"] = "MUT"
+        e = store.search_memories("hello")[0]
+        self.assertEqual(e["text"], "hello world")
+        self.assertEqual(e["tags"], ["t"])
+
+    def test_root_cache_follows_new_store(self):
+        """A cached store lookup gives way to a store created closer to cwd."""
+        store.init_store()
+        sub = Path(self.tmpdir) / "sub"
+        sub.mkdir()
+        os.chdir(sub)
+        self.assertEqual(store._root().resolve(), (Path(self.tmpdir) / ".agent-memory").resolve())
+        store.init_store()
+        self.assertEqual(store._root().resolve(), (sub / ".agent-memory").resolve())
+
+    def test_cli_compact_from_subdir(self):
+        """compact finds the store above cwd like the other commands do."""
+        store.init_store()
+        e = store.add_memory("old entry")
+        store.add_memory("kept entry")
+        store.delete_memory(e["id"])
+        sub = Path(self.tmpdir) / "sub"
+        sub.mkdir()
+        os.chdir(sub)
+        with mock.patch.object(sys, "argv", ["agent-memory", "compact"]):
+            cli.main()
+        lines = (Path(self.tmpdir) / ".agent-memory" / "memories.jsonl").read_text().splitlines()
+        self.assertEqual([json.loads(l)["text"] for l in lines], ["kept entry"])
+
+    def test_cli_compact_uninitialized(self):
+        """compact without a store prints the usual message, not a traceback."""
+        out = io.StringIO()
+        with mock.patch.object(sys, "argv", ["agent-memory", "compact"]), redirect_stdout(out):
+            with self.assertRaises(SystemExit):
+                cli.main()
+        self.assertIn("Not initialized", out.getvalue())
+
     def test_config_command(self):
         """agent-memory config shows current configuration."""
         store.init_store()
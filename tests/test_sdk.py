@@ -120,3 +120,377 @@ def test_not_initialized():
             assert False, "Should have raised"
         except FileNotFoundError:
             pass
+
+
+def test_cache_sees_writes_from_other_instances():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        e = mem.add("first")
+        assert mem.count() == 1
+        other = Memory(tmp)
+        other.add("second")
+        assert mem.count() == 2
+        other.delete(e["id"])
+        assert [x["text"] for x in mem.list()] == ["second"]
+
+
+def test_get_cold_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        e = mem.add("target")
+        # Another entry mentions the same id in nested metadata
+        mem.add("decoy", metadata={"id": e["id"]})
+        fresh = Memory(tmp)
+        assert fresh.get(e["id"])["text"] == "target"
+        assert fresh.get("nonexistent") is None
+
+
+def test_search_index_tracks_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        mem.add("alpha note")
+        mem.add("unrelated filler")
+        assert [r["text"] for r in mem.search("beta")] == []
+        e = mem.add("beta note")
+        assert [r["text"] for r in mem.search("beta")] == ["beta note"]
+        mem.tag(e["id"], add=["gamma"])
+        assert [r["text"] for r in mem.search("gamma")] == ["beta note"]
+        mem.delete(e["id"])
+        assert mem.search("beta") == []
+
+
+def test_text_with_unicode_line_separator():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        e = mem.add("first\u2028second")
+        assert Memory(tmp).list()[0]["text"] == e["text"]
+
+
+def test_search_tag_without_query():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        mem.add("one", tags=["keep"])
+        mem.add("two")
+        mem.add("three", tags=["keep", "other"])
+        results = mem.search("", tag="keep")
+        assert [r["text"] for r in results] == ["one", "three"]
+        assert mem.search("", tag="missing") == []
+
+
+def test_search_ties_keep_store_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp, config={"time_decay_lambda": 0})
+        mem.init()
+        mem.add("filler text")
+        ids = [mem.add("same words")["id"] for _ in range(4)]
+        assert [r["id"] for r in mem.search("same", limit=3)] == ids[:3]
+
+
+def test_delete_and_tag_append_records():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        keep = [mem.add(f"keep {i}") for i in range(5)]
+        gone = mem.add("gone")
+        mem.tag(keep[0]["id"], add=["x", "y"])
+        mem.tag(keep[0]["id"], remove=["x"])
+        mem.delete(gone["id"])
+        lines = mem._memories_path.read_text().splitlines()
+        assert len(lines) == 9  # edits were appended, not rewritten
+
+        fresh = Memory(tmp)
+        assert [e["id"] for e in fresh.list()] == [e["id"] for e in keep]
+        assert fresh.get(keep[0]["id"])["tags"] == ["y"]
+        assert Memory(tmp).get(gone["id"]) is None
+
+        assert fresh.compact() == 4
+        assert len(mem._memories_path.read_text().splitlines()) == 5
+        assert fresh.get(keep[0]["id"])["tags"] == ["y"]
+
+
+def test_many_deletes_trigger_compaction():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        entries = [mem.add(f"entry {i}") for i in range(4)]
+        for e in entries[:3]:
+            mem.delete(e["id"])
+        lines = mem._memories_path.read_text().splitlines()
+        assert len(lines) <= 2 * mem.count()
+        assert [e["text"] for e in Memory(tmp).list()] == ["entry 3"]
+
+
+def test_count_cold_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        assert Memory(tmp).count() == 0
+        entries = [mem.add(f"entry {i}") for i in range(4)]
+        assert len(Memory(tmp)) == 4
+        mem.tag(entries[0]["id"], add=["x"])
+        mem.delete(entries[1]["id"])
+        assert Memory(tmp).count() == 3
+
+
+def test_stream_export_matches_export():
+    import io
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        mem.add("one", tags=["a", "b"])
+        mem.add("two\nlines", metadata={"k": [1, {}]})
+        for fmt in ("md", "json"):
+            buf = io.StringIO()
+            mem.stream_export(buf, fmt)
+            assert buf.getvalue() == mem.export(fmt)
+        assert json.loads(mem.export("json")) == mem.list()
+        out = mem.export_to_file(Path(tmp) / "export.md")
+        assert out.read_text(encoding="utf-8") == mem.export()
+
+
+def test_list_cold_cache_reads_tail():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        entries = [mem.add(f"entry {i} " + "padding " * 10) for i in range(300)]
+        for e in entries[250::3]:
+            mem.delete(e["id"])
+        mem.tag(entries[-1]["id"], add=["late"])
+        mem.tag(entries[0]["id"], add=["early"])
+        full = mem._load_all()
+        for n in (1, 5, 40, 200, 1000):
+            assert Memory(tmp).list(n) == full[-n:]
+
+        # A duplicate id before the window: the patch hits the older copy
+        with open(mem._memories_path, "a") as f:
+            f.write(json.dumps(dict(entries[0], tags=[])) + "\n")
+        last = Memory(tmp).list(1)
+        assert [e["id"] for e in last] == [entries[0]["id"]]
+        assert last[0]["tags"] == []
+
+
+def test_keyword_index_sidecar():
+    from agent_memory._index import INDEX_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = {"time_decay_lambda": 0}
+        mem = Memory(tmp, cfg)
+        mem.init()
+        mem.add("alpha one")
+        mem.add("beta two")
+        assert [r["text"] for r in mem.search("alpha")] == ["alpha one"]
+        sidecar = mem.store / INDEX_FILE
+        assert sidecar.exists()
+        assert [r["text"] for r in Memory(tmp, cfg).search("beta")] == ["beta two"]
+
+        # Appended entries extend the saved index
+        mem.add("alpha three")
+        assert [r["text"] for r in Memory(tmp, cfg).search("alpha")] == ["alpha one", "alpha three"]
+
+        # Deletes and rewrites don't reuse stale postings
+        e = Memory(tmp, cfg).search("beta")[0]
+        mem.delete(e["id"])
+        assert Memory(tmp, cfg).search("beta") == []
+        mem.compact()
+        assert not sidecar.exists()
+        assert [r["text"] for r in Memory(tmp, cfg).search("two alpha")] == ["alpha one", "alpha three"]
+
+
+def test_keyword_index_sidecar_is_validated():
+    from agent_memory._index import INDEX_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = {"time_decay_lambda": 0}
+        mem = Memory(tmp, cfg)
+        mem.init()
+        legacy = mem.store / "memories.index.json"
+        legacy.write_text("{}")
+        mem.add_many(["alpha one", "beta two"])
+        mem.search("alpha")
+        sidecar = mem.store / INDEX_FILE
+        assert sidecar.exists() and not legacy.exists()
+        data = sidecar.read_bytes()
+        for broken in (data[:-3], data[:len(data) // 2], b"junk\n" + data, b""):
+            sidecar.write_bytes(broken)
+            assert [r["text"] for r in Memory(tmp, cfg).search("beta")] == ["beta two"]
+
+
+def test_keyword_index_sidecar_sees_in_place_edits():
+    from agent_memory._index import INDEX_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = {"time_decay_lambda": 0}
+        mem = Memory(tmp, cfg)
+        mem.init()
+        mem.add_many(["apple pie", "plain bread"])
+        mem.search("apple")  # writes the sidecar
+        assert (mem.store / INDEX_FILE).exists()
+        # Same length, so only the file contents tell the sidecar is stale
+        p = mem._memories_path
+        p.write_bytes(p.read_bytes().replace(b"apple pie", b"mango pie"))
+        Memory(tmp, cfg).add("more pie")
+        fresh = Memory(tmp, cfg)
+        assert [r["text"] for r in fresh.search("mango")] == ["mango pie"]
+        assert fresh.search("apple") == []
+
+
+def test_tag_updates_keyword_index_in_place():
+    from agent_memory._index import KeywordIndex
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = {"time_decay_lambda": 0}
+        mem = Memory(tmp, cfg)
+        mem.init()
+        e = mem.add("plain words", tags=["old"])
+        mem.add("filler entry")
+        mem.search("words")  # builds the index and its sidecar
+        index = mem._kw_index[1]
+        mem.tag(e["id"], add=["fresh", "words"], remove=["old"])
+        assert mem._kw_index[1] is index
+        assert mem.search("old") == []
+        assert [r["id"] for r in mem.search("fresh")] == [e["id"]]
+        rebuilt = KeywordIndex(mem._load_all())
+        assert index.scores({"words"}) == rebuilt.scores({"words"})
+        # A new process replays the tag patch on top of the sidecar
+        other = Memory(tmp, cfg)
+        assert [r["id"] for r in other.search("fresh")] == [e["id"]]
+        assert other.search("old") == []
+
+
+def test_delete_updates_keyword_index_in_place():
+    from agent_memory._index import INDEX_FILE, KeywordIndex
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = {"time_decay_lambda": 0}
+        mem = Memory(tmp, cfg)
+        mem.init()
+        entries = mem.add_many([f"item {i} words" for i in range(10)] + ["special words", "more words"])
+        mem.search("words")  # builds the index and its sidecar
+        index = mem._kw_index[1]
+        mem.delete(entries[-2]["id"])
+        assert mem._kw_index[1] is index
+        assert mem.search("special") == []
+        rebuilt = KeywordIndex(mem._load_all())
+        def by_id(ix):
+            return {ix.entries[d]["id"]: s for d, s in ix.scores({"words", "item"}).items()}
+        assert by_id(index) == by_id(rebuilt)
+
+        # A new process replays the delete on top of the sidecar, without a rebuild
+        sidecar = (mem.store / INDEX_FILE).read_bytes()
+        other = Memory(tmp, cfg)
+        assert other.search("special") == []
+        assert [r["id"] for r in other.search("words more")] == [r["id"] for r in mem.search("words more")]
+        assert (mem.store / INDEX_FILE).read_bytes() == sidecar
+
+        # Enough deletes to rewrite the sidecar, which drops the holes
+        for e in entries[:3]:
+            mem.delete(e["id"])
+        other = Memory(tmp, cfg)
+        assert [r["id"] for r in other.search("item words", limit=20)] == [r["id"] for r in mem.search("item words", limit=20)]
+        assert (mem.store / INDEX_FILE).read_bytes() != sidecar
+        assert [r["id"] for r in Memory(tmp, cfg).search("item", limit=20)] == [e["id"] for e in entries[3:10]]
+
+
+def test_cold_lookups_replay_one_id():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        e = mem.add("patched", tags=["a"])
+        other = mem.add("other")
+        Memory(tmp).tag(e["id"], add=["b"])
+        Memory(tmp).tag(e["id"], remove=["a"])
+        assert Memory(tmp).get(e["id"])["tags"] == ["b"]
+        assert Memory(tmp).tag(e["id"], add=["c"])["tags"] == ["b", "c"]
+        assert Memory(tmp).delete(other["id"]) is True
+        assert Memory(tmp).delete(other["id"]) is False
+        assert Memory(tmp).tag(other["id"], add=["x"]) is None
+
+        # Re-adding a deleted id, and duplicate ids, still follow full replay
+        with open(mem._memories_path, "a") as f:
+            f.write(json.dumps(dict(other, text="re-added")) + "\n")
+        assert Memory(tmp).get(other["id"])["text"] == "re-added"
+        with open(mem._memories_path, "a") as f:
+            f.write(json.dumps(dict(e, text="duplicate", tags=[])) + "\n")
+        assert Memory(tmp).get(e["id"]) == mem._load_all()[0]
+        assert Memory(tmp).get(e["id"])["tags"] == ["b", "c"]
+
+
+def test_batch_buffers_writes():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        first = mem.add("before batch")
+        with mem.batch():
+            added = [mem.add(f"batched {i}") for i in range(3)]
+            assert Memory(tmp).count() == 1  # still queued
+            mem.tag(first["id"], add=["x"])
+            assert [e["id"] for e in mem.list()] == [first["id"]] + [e["id"] for e in added]
+            assert Memory(tmp).count() == 4  # the read above flushed the queue
+            mem.add("last")
+        assert [e["text"] for e in Memory(tmp).list()][-1] == "last"
+        assert Memory(tmp).get(first["id"])["tags"] == ["x"]
+
+        # A store recreated under an open handle gets written, not the old file
+        mem._memories_path.unlink()
+        mem._memories_path.touch()
+        mem.add("after replace")
+        assert [e["text"] for e in Memory(tmp).list()] == ["after replace"]
+        mem.close()
+
+
+def test_add_many():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp, {"time_decay_lambda": 0})
+        mem.init()
+        mem.add("existing words")
+        mem.search("words")  # warm the cache and index
+        added = mem.add_many([
+            "plain text words",
+            {"text": "tagged", "tags": ["t"], "importance": 9, "metadata": {"k": 1}},
+        ])
+        assert added[1]["tags"] == ["t"] and added[1]["importance"] == 5
+        assert added[0]["timestamp"] == added[1]["timestamp"]
+        assert mem.add_many([]) == []
+        assert len(mem._memories_path.read_text().splitlines()) == 3
+        assert Memory(tmp).list() == mem.list()
+        assert [r["id"] for r in mem.search("t")] == [added[1]["id"]]
+        assert len(mem.search("words")) == 2
+        assert mem.get(added[0]["id"]) == added[0]
+
+
+def test_returned_entries_are_copies():
+    """Editing a returned entry doesn't change the store or its caches."""
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        e = mem.add("hello world", tags=["t"], metadata={"k": {"v": 1}})
+        others = mem.add_many(["filler one", "filler two", "filler three"])
+        for r in (e, mem.search("hello")[0], mem.get(e["id"]), mem.list()[0]):
+            r["text"] = "TRUNCATED FOR DISPLAY"
+            r["tags"].append("x")
+            r["metadata"]["k"]["v"] = 2
+        for o in others:
+            mem.delete(o["id"])
+        mem.compact()
+        expected = {"text": "hello world", "tags": ["t"], "metadata": {"k": {"v": 1}}}
+        got = mem.get(e["id"])
+        assert {k: got[k] for k in expected} == expected
+        assert json.loads(mem.export("json"))[0]["text"] == "hello world"
+        assert mem.search("hello")[0]["id"] == e["id"]
+        lines = (Path(tmp) / ".agent-memory" / "memories.jsonl").read_text().splitlines()
+        stored = [json.loads(line) for line in lines]
+        assert [{k: s[k] for k in expected} for s in stored] == [expected]
+
+
+def test_tag_returns_copy():
+    with tempfile.TemporaryDirectory() as tmp:
+        mem = Memory(tmp)
+        mem.init()
+        e = mem.add("hello world")
+        mem.search("hello")  # warm the caches
+        tagged = mem.tag(e["id"], add=["a"])
+        tagged["tags"].append("b")
+        assert mem.get(e["id"])["tags"] == ["a"]
+        assert mem.search("hello", tag="b") == []
+        mem.compact()
+        assert Memory(tmp).get(e["id"])["tags"] == ["a"]
@@ -107,3 +107,50 @@ class TestCombined:
         results = mem.search("critical security alert")
         assert len(results) == 2
         assert results[0]["importance"] == 5
+
+    def test_bulk_scoring_matches_per_entry(self, mem, monkeypatch):
+        from agent_memory import _index
+        if _index.np is None:
+            pytest.skip("numpy not installed")
+        _add_filler(mem)
+        for days in (0, 3, 40, 200):
+            _inject(mem, "shared keyword", days_ago=days, importance=1 + days % 5)
+        with open(mem._memories_path, "a") as f:
+            f.write(json.dumps({"id": "notimestamp1", "text": "shared keyword"}) + "\n")
+        expected = [e["id"] for e in mem.search("shared keyword")]
+        monkeypatch.setattr(_index, "_NUMPY_MIN_HITS", 1)
+        assert [e["id"] for e in Memory(str(mem._root), mem._config).search("shared keyword")] == expected
+
+    def test_dense_kernel_matches_per_entry(self, mem, monkeypatch):
+        from agent_memory import _index
+        if _index.np is None:
+            pytest.skip("numpy not installed")
+
+        class _NoJit:  # run the numba kernel as plain Python
+            @staticmethod
+            def njit(**kwargs):
+                return lambda f: f
+
+        _add_filler(mem)
+        for days in (0, 3, 40, 200):
+            _inject(mem, "shared keyword", days_ago=days, importance=1 + days % 5)
+        expected = [e["id"] for e in mem.search("shared keyword")]
+        monkeypatch.setattr(_index, "numba", _NoJit)
+        monkeypatch.setattr(_index, "_jitted_final_scores", None)
+        monkeypatch.setattr(_index, "_NUMPY_MIN_HITS", 1)
+        monkeypatch.setattr(_index, "_NUMBA_MIN_HITS", 1)
+        assert [e["id"] for e in Memory(str(mem._root), mem._config).search("shared keyword")] == expected
+
+
+class TestClock:
+    def test_injected_clock_drives_timestamps_and_decay(self, tmp_path):
+        now = [datetime(2026, 1, 1, tzinfo=timezone.utc)]
+        m = Memory(str(tmp_path), config={"time_decay_lambda": 0.05}, clock=lambda: now[0])
+        m.init()
+        _add_filler(m)
+        old = m.add("python programming tips")
+        now[0] += timedelta(days=100)
+        new, = m.add_many(["python programming tips"])
+        assert old["timestamp"] == "2026-01-01T00:00:00+00:00"
+        assert new["timestamp"] == "2026-04-11T00:00:00+00:00"
+        assert [e["id"] for e in m.search("python programming")] == [new["id"], old["id"]]
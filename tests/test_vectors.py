@@ -1,13 +1,26 @@
 """Tests for vector embedding support (mocked API)."""
+import http.server
+import io
 import json
 import math
 import os
+import shutil
+import sys
 import tempfile
+import threading
 import unittest
+import zlib
+from contextlib import redirect_stdout
 from unittest.mock import patch, MagicMock
 
 from agent_memory.sdk import Memory
-from agent_memory.embeddings import cosine_similarity, VectorStore, get_embeddings
+from agent_memory import cli, embeddings
+from agent_memory.embeddings import cosine_similarity, VectorStore, get_embeddings, np
+
+
+def _h(word):
+    """Stable word -> dimension hash (built-in hash() varies with PYTHONHASHSEED)."""
+    return zlib.crc32(word.encode()) & 15
 
 
 class TestCosineSimilarity(unittest.TestCase):
@@ -23,11 +36,80 @@ class TestCosineSimilarity(unittest.TestCase):
 
     def test_zero_vector(self):
         self.assertEqual(cosine_similarity([0, 0], [1, 2]), 0.0)
+        self.assertEqual(cosine_similarity([0, 0], [0, 0]), 0.0)
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_backends_agree(self):
+        rng = np.random.default_rng(0)
+        a, b = rng.standard_normal((2, 64)).astype(np.float32)
+        expected = cosine_similarity(a.tolist(), b.tolist())
+        with patch.object(embeddings, "simsimd", None):
+            self.assertAlmostEqual(cosine_similarity(a, b), expected, places=5)
+        with patch.object(embeddings, "np", None):
+            self.assertAlmostEqual(cosine_similarity(a.tolist(), b.tolist()), expected, places=5)
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_mismatched_lengths(self):
+        a, b = [1.0, 2.0], [1.0, 0.0, 2.0]
+        expected = 1.0 / (math.sqrt(5) * math.sqrt(5))
+        self.assertAlmostEqual(cosine_similarity(a, b), expected)
+        self.assertAlmostEqual(cosine_similarity(np.array(b), np.array(a)), expected)
+        with patch.object(embeddings, "simsimd", None):
+            self.assertAlmostEqual(cosine_similarity(a, b), expected)
+        with patch.object(embeddings, "np", None):
+            self.assertAlmostEqual(cosine_similarity(a, b), expected)
+
+
+class _FakeEmbeddingHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    clients = set()
+
+    def do_POST(self):
+        self.clients.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        data = [{"index": i, "embedding": [float(len(t))]} for i, t in enumerate(body["input"])]
+        out = json.dumps({"data": data[::-1]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestGetEmbeddings(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _FakeEmbeddingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.config = {"embedding": {
+            "api_base": f"http://127.0.0.1:{self.server.server_port}/v1",
+            "api_key": "fake-key",
+        }}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_orders_by_index_and_reuses_connection(self):
+        _FakeEmbeddingHandler.clients.clear()
+        for _ in range(3):
+            self.assertEqual(get_embeddings(["a", "bbb"], self.config), [[1.0], [3.0]])
+        self.assertEqual(len(_FakeEmbeddingHandler.clients), 1)
 
 
 class TestVectorSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # One root per class, RAM-backed where available; each test gets a subdir
+        cls._root = tempfile.mkdtemp(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls._root, ignore_errors=True)
+
     def setUp(self):
-        self.tmpdir = tempfile.mkdtemp()
+        self.tmpdir = tempfile.mkdtemp(dir=self._root)
         self.mem = Memory(self.tmpdir, config={
             "embedding": {
                 "api_base": "http://fake",
@@ -36,16 +118,25 @@ class TestVectorSearch(unittest.TestCase):
             }
         })
         self.mem.init()
+        embeddings._query_cache.clear()
 
     def _mock_embeddings(self, texts):
         """Generate simple deterministic embeddings for testing."""
+        words = [text.lower().split() for text in texts]
+        if np is not None:
+            # One histogram over row * 16 + dim gives the (texts, 16) word counts
+            idx = np.fromiter((_h(w) for ws in words for w in ws), dtype=np.int64)
+            idx += 16 * np.repeat(np.arange(len(texts)), [len(ws) for ws in words])
+            vec = np.bincount(idx, minlength=16 * len(texts)).reshape(len(texts), 16).astype(np.float64)
+            norms = np.linalg.norm(vec, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            return (vec / norms).tolist()
         vectors = []
-        for text in texts:
-            words = text.lower().split()
+        for ws in words:
             # Simple: hash each word to a dimension
             vec = [0.0] * 16
-            for w in words:
-                idx = hash(w) % 16
+            for w in ws:
+                idx = _h(w)
                 vec[idx] += 1.0
             # Normalize
             norm = math.sqrt(sum(x*x for x in vec)) or 1.0
@@ -57,13 +148,164 @@ class TestVectorSearch(unittest.TestCase):
         # Make get_embeddings return deterministic vectors
         mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
 
-        self.mem.add("the cat sat on the mat", tags=["animal"])
-        self.mem.add("python programming language", tags=["code"])
-        self.mem.add("the dog played in the park", tags=["animal"])
+        self.mem.add_many([
+            {"text": "the cat sat on the mat", "tags": ["animal"]},
+            {"text": "python programming language", "tags": ["code"]},
+            {"text": "the dog played in the park", "tags": ["animal"]},
+        ])
+        self.assertEqual(mock_get_emb.call_count, 1)
 
         results = self.mem.search("cat and dog animals", mode="vector")
         self.assertTrue(len(results) > 0)
 
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_search_with_other_query_dimension(self, mock_get_emb):
+        # e.g. the embedding model changed without a rebuild_vectors()
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+        self.mem.add("the cat sat on the mat")
+        self.mem.add("python programming language")
+        mock_get_emb.side_effect = lambda texts, config: [v[:8] for v in self._mock_embeddings(texts)]
+        self.assertTrue(self.mem.search("cat on the mat", mode="vector"))
+        self.assertTrue(self.mem.search("cat on the mat", mode="hybrid"))
+        # A store holding vectors of both lengths is searchable too
+        self.mem.add("the dog played in the park")
+        self.assertTrue(self.mem.search("dog in the park", mode="vector"))
+
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_vector_search_skips_keyword_index(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+        gone = self.mem.add("the cat sat on the mat")
+        self.mem.add("python programming language")
+        fresh = Memory(self.tmpdir, config=self.mem._config)
+        self.assertEqual(fresh.search("cat on the mat", mode="vector")[0]["id"], gone["id"])
+        self.assertFalse((fresh.store / "memories.index").exists())
+        # Same length as before, different entries
+        fresh.delete(gone["id"])
+        late = fresh.add("the cat sat on the mat again")
+        self.assertEqual(fresh.search("cat on the mat", mode="vector")[0]["id"], late["id"])
+
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_vector_search_ranks_exact_match_first(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+
+        self.mem.add("python programming language")
+        target = self.mem.add("the cat sat on the mat")
+        self.mem.add("cooking recipes for dinner")
+
+        results = self.mem.search("the cat sat on the mat", mode="vector")
+        self.assertEqual(results[0]["id"], target["id"])
+        results = self.mem.search("the cat sat on the mat", mode="vector", limit=1)
+        self.assertEqual([r["id"] for r in results], [target["id"]])
+
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_query_cache_hit(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+        self.mem.add("the cat sat on the mat")
+
+        mock_get_emb.reset_mock()
+        first = self.mem.search("cat on a mat", mode="vector")
+        self.assertEqual(self.mem.search("cat on a mat", mode="vector"), first)
+        self.mem.search("cat on a mat", mode="hybrid")
+        self.assertEqual(mock_get_emb.call_count, 1)
+        # Failures aren't cached
+        mock_get_emb.side_effect = None
+        mock_get_emb.return_value = None
+        self.assertEqual(self.mem.search("dog", mode="vector"), [])
+        self.mem.search("dog", mode="vector")
+        self.assertEqual(mock_get_emb.call_count, 3)
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_int8_search(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+        config = {"embedding": dict(self.mem._config["embedding"], storage="int8")}
+        mem = Memory(self.tmpdir, config=config)
+
+        mem.add("python programming language")
+        target = mem.add("the cat sat on the mat")
+        mem.add("cooking recipes for dinner")
+
+        results = mem.search("the cat sat on the mat", mode="vector")
+        self.assertEqual(results[0]["id"], target["id"])
+        self.assertEqual(np.load(mem.store / "vectors.npy").dtype, np.int8)
+        # Reloaded from the sidecar, and scored by each int8 kernel
+        class _NoJit:  # run the numba kernel as plain Python
+            @staticmethod
+            def njit(**kwargs):
+                return lambda f: f
+
+        for kernel in ("numba", "simsimd", "numpy"):
+            with patch.dict(os.environ, {"AGENT_MEMORY_KERNEL": kernel}), \
+                    patch("agent_memory.embeddings.numba", _NoJit), \
+                    patch("agent_memory.embeddings._jitted_int8_dots", None):
+                results = Memory(self.tmpdir, config=config).search("the cat sat on the mat", mode="vector")
+            self.assertEqual(results[0]["id"], target["id"])
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_search_reuses_entry_rows(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+        entries = self.mem.add_many(["the cat sat on the mat", "python programming language"])
+
+        self.mem.search("cat", mode="vector")
+        cached = self.mem.vectors._rows_cache
+        self.mem.search("python", mode="vector")
+        self.assertIs(self.mem.vectors._rows_cache, cached)
+        # Adds and deletes are picked up
+        late = self.mem.add("the cat sat on a hat")
+        self.assertIn(late["id"], [e["id"] for e in self.mem.search("cat hat", mode="vector")])
+        self.mem.vectors.delete(entries[0]["id"])
+        self.assertNotIn(entries[0]["id"], [e["id"] for e in self.mem.search("cat mat", mode="vector")])
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_binary_search_recall(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+        texts = [
+            "the cat sat on the mat",
+            "python programming language",
+            "cooking recipes for dinner",
+            "the dog played in the park",
+        ]
+        self.mem.add_many(texts)
+        config = {"embedding": dict(self.mem._config["embedding"], storage="binary")}
+
+        for query in texts:
+            expected = self.mem.search(query, mode="vector", limit=1)
+            for kernel in ("simsimd", "numpy"):
+                with patch.dict(os.environ, {"AGENT_MEMORY_KERNEL": kernel}):
+                    results = Memory(self.tmpdir, config=config).search(query, mode="vector", limit=1)
+                self.assertEqual(results, expected)
+        bits = np.load(self.mem.store / "vectors.npy")
+        self.assertEqual((bits.dtype, bits.shape), (np.uint8, (4, 2)))
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_ivf_recall(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+
+        self.mem.add("the cat sat on the mat")
+        self.mem.add("python programming language")
+        self.mem.add("the dog played in the park")
+        query = "cat and dog animals"
+        exact = [e["id"] for e in self.mem.search(query, mode="vector")]
+
+        self.assertEqual(self.mem.build_ivf(nlist=2), 2)
+        self.assertTrue((self.mem.store / "vectors.ivf.npz").exists())
+        entries = self.mem._load_all()
+        probed = [e["id"] for e in self.mem.vectors.search(query, entries, 10, nprobe=2)]
+        self.assertEqual(probed, exact)
+        # One list: a subset of the exact ranking, in the same order
+        probed = [e["id"] for e in self.mem.vectors.search(query, entries, 10, nprobe=1)]
+        self.assertTrue(probed)
+        self.assertEqual(probed, [mid for mid in exact if mid in probed])
+
+        # Vectors added after the build are always scored
+        late = self.mem.add("cat and dog animals")
+        fresh = Memory(self.tmpdir, config=self.mem._config)
+        results = fresh.vectors.search(query, fresh._load_all(), 10, nprobe=1)
+        self.assertEqual(results[0]["id"], late["id"])
+
     @patch("agent_memory.embeddings.get_embeddings")
     def test_rebuild_vectors(self, mock_get_emb):
         mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
@@ -77,6 +319,49 @@ class TestVectorSearch(unittest.TestCase):
         count = self.mem.rebuild_vectors()
         self.assertEqual(count, 2)
 
+        # Only the memory without a vector is sent when filling gaps
+        mem_no_emb.add("memory three")
+        mock_get_emb.reset_mock()
+        self.assertEqual(self.mem.rebuild_vectors(missing_only=True), 1)
+        self.assertEqual(mock_get_emb.call_args[0][0], ["memory three"])
+        self.assertEqual(len(self.mem.vectors._load_vectors()), 3)
+
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_cli_rebuild_missing_when_complete(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+        self.mem.add("memory one")
+
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir)
+        try:
+            out = io.StringIO()
+            with patch.object(sys, "argv", ["agent-memory", "rebuild-vectors", "--missing"]), \
+                    redirect_stdout(out):
+                cli.main()
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(out.getvalue().strip(), "All memories already have vectors.")
+
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_rebuild_batches_keep_input_order(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+
+        entries = [{"id": f"m{i}", "text": f"memory {i}"} for i in range(7)]
+        count = self.mem.vectors.rebuild(entries, batch_size=2, workers=3)
+        self.assertEqual(count, 7)
+        self.assertEqual(mock_get_emb.call_count, 4)
+        self.assertEqual(list(self.mem.vectors._load_vectors()), [e["id"] for e in entries])
+        fresh = VectorStore(self.mem.vectors._vectors_path.parent, self.mem._config)
+        self.assertEqual(list(fresh._load_vectors()), [e["id"] for e in entries])
+
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_add_many_embeds_in_batches(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+
+        entries = self.mem.add_many([f"memory {i}" for i in range(5)], batch_size=2)
+        self.assertEqual(mock_get_emb.call_count, 3)
+        self.assertEqual(list(self.mem.vectors._load_vectors()), [e["id"] for e in entries])
+
     @patch("agent_memory.embeddings.get_embeddings")
     def test_delete_removes_vector(self, mock_get_emb):
         mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
@@ -84,10 +369,85 @@ class TestVectorSearch(unittest.TestCase):
         entry = self.mem.add("test memory")
         vectors = self.mem.vectors._load_vectors()
         self.assertIn(entry["id"], vectors)
+        self.assertTrue(self.mem.vectors.contains(entry["id"]))
 
         self.mem.delete(entry["id"])
         vectors = self.mem.vectors._load_vectors()
         self.assertNotIn(entry["id"], vectors)
+        self.assertFalse(self.mem.vectors.contains(entry["id"]))
+
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_delete_appends_tombstone(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+
+        entries = self.mem.add_many([f"memory number {i}" for i in range(6)])
+        self.mem.search("memory", mode="vector")  # warm the matrix
+        self.mem.delete(entries[0]["id"])
+        lines = self.mem.vectors._vectors_path.read_text().splitlines()
+        self.assertEqual(len(lines), 7)
+        results = self.mem.search("memory number 0", mode="vector", limit=10)
+        self.assertNotIn(entries[0]["id"], [r["id"] for r in results])
+        fresh = VectorStore(self.mem.vectors._vectors_path.parent, self.mem._config)
+        self.assertEqual(list(fresh._load_vectors()), [e["id"] for e in entries[1:]])
+
+        # Compacted once dead lines outnumber live vectors
+        for e in entries[1:4]:
+            self.mem.delete(e["id"])
+        lines = self.mem.vectors._vectors_path.read_text().splitlines()
+        self.assertLessEqual(len(lines), 2 * 2)
+        fresh = VectorStore(self.mem.vectors._vectors_path.parent, self.mem._config)
+        self.assertEqual(list(fresh._load_vectors()), [e["id"] for e in entries[4:]])
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_delete_through_matrix_sidecar(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+
+        entries = self.mem.add_many([f"memory number {i}" for i in range(6)])
+        self.mem.search("memory", mode="vector")  # writes the sidecar
+        store_dir = self.mem.vectors._vectors_path.parent
+        cold = VectorStore(store_dir, self.mem._config)
+        cold.delete(entries[0]["id"])
+        self.assertFalse(cold.contains(entries[0]["id"]))
+        self.assertTrue(cold.contains(entries[1]["id"]))
+        self.assertIsNone(cold._cache)  # vectors.jsonl was never parsed
+        fresh = VectorStore(store_dir, self.mem._config)
+        m = fresh._matrix()
+        self.assertIsNone(fresh._cache)  # sidecar still matches the file
+        self.assertNotIn(entries[0]["id"], m.rows)
+        self.assertEqual(list(fresh._load_vectors()), [e["id"] for e in entries[1:]])
+
+    def test_pure_python_scores_match_cosine(self):
+        vs = self.mem.vectors
+        vs._append_vectors([("a", [3.0, 4.0]), ("b", [0.0, 0.0]), ("c", [-1.0, 2.0])])
+        entries = [{"id": mid} for mid in "abc"]
+        with patch("agent_memory.embeddings.np", None):
+            sims, _ = vs._similarities([1.0, 1.0], entries)
+            for sim, e in zip(sims, entries):
+                self.assertAlmostEqual(sim, cosine_similarity([1.0, 1.0], vs._vectors()[e["id"]]))
+            # Re-embedding an id replaces its memoized norm
+            vs._append_vectors([("a", [1.0, 1.0])])
+            sims, _ = vs._similarities([1.0, 1.0], entries)
+        self.assertAlmostEqual(sims[0], 1.0)
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    @patch("agent_memory.embeddings.get_embeddings")
+    def test_matrix_sidecar_tracks_vectors_file(self, mock_get_emb):
+        mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
+
+        keep = self.mem.add("the cat sat on the mat")
+        gone = self.mem.add("python programming language")
+        self.mem.search("cat", mode="vector")
+        self.assertTrue((self.mem.store / "vectors.npy").exists())
+
+        fresh = Memory(self.tmpdir, config=self.mem._config)
+        results = fresh.search("python programming language", mode="vector")
+        self.assertEqual(results[0]["id"], gone["id"])
+
+        self.mem.delete(gone["id"])
+        fresh = Memory(self.tmpdir, config=self.mem._config)
+        results = fresh.search("python programming language", mode="vector")
+        self.assertEqual([r["id"] for r in results], [keep["id"]])
 
     def test_no_embedding_config(self):
         mem = Memory(self.tmpdir)  # No embedding config
@@ -97,16 +457,19 @@ class TestVectorSearch(unittest.TestCase):
     def test_hybrid_search(self, mock_get_emb):
         mock_get_emb.side_effect = lambda texts, config: self._mock_embeddings(texts)
 
-        self.mem.add("machine learning with python")
-        self.mem.add("cooking recipes for dinner")
-        self.mem.add("python data science tutorial")
+        self.mem.add_many([
+            "machine learning with python",
+            "cooking recipes for dinner",
+            "python data science tutorial",
+        ])
+        self.assertEqual(mock_get_emb.call_count, 1)
 
         results = self.mem.search("python programming", mode="hybrid")
         self.assertTrue(len(results) > 0)
 
     def test_keyword_fallback_without_embeddings(self):
         """Without embedding config, search falls back to keyword."""
-        tmpdir2 = tempfile.mkdtemp()
+        tmpdir2 = tempfile.mkdtemp(dir=self._root)
         mem = Memory(tmpdir2)
         mem.init()
         mem.add("hello world test")